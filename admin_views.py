@@ -0,0 +1,549 @@
+from flask import Response, render_template, stream_template, request, redirect, url_for, session, flash, get_flashed_messages, make_response
+from datetime import datetime
+import csv
+import io
+import itertools
+import json
+import os
+import time
+from admin_forms import AdminLoginForm
+from app import (ADMIN_PASSWORD, EVENT_POLL_INTERVAL, EVENT_STREAM_SECONDS, HISTORY_PAGE_SIZE, MATCH_WEIGHT,
+                 RATINGS_PER_PAGE, SCHEDULE_FILE, SCORING_MODES, cached, calculate_ratings_statistics,
+                 data_validators, generate_teams, not_modified, render_fragment, set_validators, store,
+                 team_options)
+from export import EXPORT_COLUMNS, EXPORT_FORMATS, match_rows, player_rows, rating_rows, stream
+from metrics import metrics
+from scheduler import FORMATS, ScheduleFile, create_schedule, fixture_members, record_result, summary as schedule_summary
+from storage import normalize_name, parse_rating
+from teams import TEAM_STRATEGIES
+
+# Tournament fixtures and results, shared by all workers
+schedule_file = ScheduleFile(SCHEDULE_FILE)
+
+# Admin login route
+def admin_login():
+    form = AdminLoginForm()
+    if form.validate_on_submit():
+        if form.password.data.strip() == ADMIN_PASSWORD:
+            session['admin_logged_in'] = True
+            flash('Logged in successfully.', 'success')
+            return redirect(url_for('admin'))
+        else:
+            flash('Incorrect password. Please try again.', 'danger')
+    return render_template('admin_login.html', form=form)
+
+def admin_tables(version, scoring, team_size, team_method):
+    """
+    :return: Tuple of functions rendering the participants, statistics and teams tables of
+             the admin page, each memoized until the next write. The streamed page calls
+             them where the tables appear, so the bytes before a table are sent before
+             it is rendered.
+    """
+    def participants_table():
+        return cached(('participants_table',),
+                      lambda: render_fragment('participants_table', participants=store.participant_rows()),
+                      version)
+
+    def statistics_table():
+        return cached(('statistics_table', scoring),
+                      lambda: render_fragment('statistics_table',
+                                              ratings_statistics=calculate_ratings_statistics(scoring, version)),
+                      version)
+
+    def teams_table():
+        return cached(('teams_table', team_size, team_method, scoring),
+                      lambda: render_fragment('teams_table', teams=generate_teams(team_size, team_method,
+                                                                                 scoring, version)),
+                      version)
+    return participants_table, statistics_table, teams_table
+
+# Admin route to view participants and ratings (requires login)
+def admin():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    # Answer with 304 Not Modified if the browser already has this exact page. Pages
+    # showing flash messages are one-offs and always rendered in full.
+    version = store.data_version()
+    etag, last_modified = data_validators(version, request.query_string.decode('utf-8', 'replace'))
+    has_flashes = bool(session.get('_flashes'))
+    if not has_flashes:
+        response = not_modified(etag, last_modified)
+        if response is not None:
+            return response
+
+    # Filtered, paginated ratings table
+    filters = {
+        'rater': request.args.get('rater', '').strip(),
+        'rated_player': request.args.get('rated_player', '').strip(),
+        'score': request.args.get('score', '').strip(),
+    }
+    per_page = min(max(request.args.get('per_page', RATINGS_PER_PAGE, type=int) or RATINGS_PER_PAGE, 1), 500)
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    ratings, ratings_total = store.query_ratings(
+        rater=filters['rater'],
+        rated_player=filters['rated_player'],
+        rating=parse_rating(filters['score']),
+        offset=(page - 1) * per_page,
+        limit=per_page
+    )
+    page_count = max((ratings_total + per_page - 1) // per_page, 1)
+
+    # Statistics ranked by raw averages or rater-bias-corrected scores, and teams (pairs of 2
+    # unless another size is requested)
+    scoring = request.args.get('scoring', 'raw')
+    if scoring not in SCORING_MODES:
+        scoring = 'raw'
+    team_size, team_method = team_options(request.args)
+    participants_table, statistics_table, teams_table = admin_tables(version, scoring, team_size, team_method)
+
+    # Pop flash messages now: once the response starts streaming the session can no
+    # longer be saved, so they would be shown again on the next page load
+    get_flashed_messages(with_categories=True)
+
+    # Stream the page so the browser gets the first bytes before all tables are rendered
+    response = make_response(stream_template(
+        'admin.html',
+        participants_table=participants_table,
+        ratings=ratings,
+        ratings_total=ratings_total,
+        ratings_offset=(page - 1) * per_page,
+        filters=filters,
+        page=page,
+        page_count=page_count,
+        per_page=per_page,
+        statistics_table=statistics_table,  # Renders the (cached) statistics table
+        teams_table=teams_table,  # Renders the (cached) team assignments
+        team_size=team_size,
+        team_method=team_method,
+        team_methods=sorted(TEAM_STRATEGIES),
+        scoring=scoring,
+        scoring_modes=SCORING_MODES,
+        match_results=MATCH_WEIGHT > 0 and bool(store.match_rows())
+    ))
+    if not has_flashes:
+        set_validators(response, etag, last_modified)
+    return response
+
+def sse_event(event, data, event_id=None):
+    # One Server-Sent Events message
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+def live_updates(event_id, resume):
+    """
+    Generates the admin event stream: a full 'snapshot' of the player statistics unless
+    the browser is resuming, then 'rating' events for new or changed ratings and 'stats'
+    events with the updated statistics of just the players involved.
+    """
+    pid = os.getpid()
+    yield 'retry: 2000\n\n'
+    if not resume:
+        yield sse_event('snapshot', {'players': store.player_statistics()}, f'{pid}-{event_id}')
+
+    deadline = time.monotonic() + EVENT_STREAM_SECONDS
+    idle_since = time.monotonic()
+    while time.monotonic() < deadline:
+        time.sleep(EVENT_POLL_INTERVAL)
+        latest, ops = store.events_since(event_id)
+        if latest == event_id:
+            if time.monotonic() - idle_since > 10:
+                yield ': keep-alive\n\n'  # Stops proxies from closing an idle connection
+                idle_since = time.monotonic()
+            continue
+        event_id = latest
+        idle_since = time.monotonic()
+
+        changed = {}
+        if ops is None or any(op['op'] in ('reload', 'remove_participant') for op in ops):
+            # Too much changed to describe as deltas
+            yield sse_event('snapshot', {'players': store.player_statistics()}, f'{pid}-{event_id}')
+            continue
+        for op in ops:
+            if op['op'] == 'add_ratings':
+                for rated_player, rating in op['ratings']:
+                    yield sse_event('rating', {'rater': op['rater'], 'rated_player': rated_player, 'rating': rating})
+                    changed[normalize_name(rated_player)] = rated_player
+            elif op['op'] in ('update_rating', 'remove_rating'):
+                if op['op'] == 'update_rating':
+                    yield sse_event('rating', {'rater': op['rater'], 'rated_player': op['rated_player'], 'rating': op['rating']})
+                changed[normalize_name(op['rated_player'])] = op['rated_player']
+            elif op['op'] == 'record_match':
+                # Every player in the match has a new Elo rating
+                for name in op['home'] + op['away']:
+                    changed[normalize_name(name)] = name
+            else:
+                changed[normalize_name(op['name'])] = op['name']
+        players, removed = store.statistics_for(changed.values())
+        yield sse_event('stats', {'players': players, 'removed': removed}, f'{pid}-{event_id}')
+
+# Admin route streaming live rating events and player statistics (requires login)
+def admin_events():
+    if not session.get('admin_logged_in'):
+        return Response(status=401)
+
+    # A browser reconnecting to the same worker carries on from its last event; anyone
+    # else starts with a full snapshot
+    event_id, resume = store.latest_event_id(), False
+    last_pid, _, last_id = request.headers.get('Last-Event-ID', '').partition('-')
+    if last_pid == str(os.getpid()) and last_id.isdigit() and store.events_since(int(last_id))[1] is not None:
+        event_id, resume = int(last_id), True
+
+    return Response(live_updates(event_id, resume), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Admin route to view the tournament schedule, or generate one from the current teams (requires login)
+def admin_schedule():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    if request.method == 'POST':
+        team_size, team_method = team_options(request.form)
+        scoring = request.form.get('scoring', 'raw')
+        if scoring not in SCORING_MODES:
+            scoring = 'raw'
+        try:
+            schedule = create_schedule(
+                generate_teams(team_size, team_method, scoring),
+                fmt=request.form.get('format', 'round_robin'),
+                consoles=request.form.get('consoles', 2, type=int) or 2,
+                group_size=request.form.get('group_size', 4, type=int) or 4,
+                advance=request.form.get('advance', 2, type=int) or 2
+            )
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin_schedule'))
+        schedule_file.save(schedule)
+        flash(f"Scheduled {len(schedule['fixtures'])} matches for {len(schedule['teams'])} teams.", 'success')
+        return redirect(url_for('admin_schedule'))
+
+    schedule = schedule_file.load()
+    return render_template('schedule.html', schedule=schedule,
+                           summary=schedule_summary(schedule) if schedule else None,
+                           formats=FORMATS, team_methods=sorted(TEAM_STRATEGIES), scoring_modes=SCORING_MODES)
+
+# Admin route to enter a match result; the rest of the schedule is recomputed (requires login)
+def admin_schedule_result():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    fixture_id = request.form.get('fixture_id', type=int)
+    home_goals = request.form.get('home_goals', type=int)
+    away_goals = request.form.get('away_goals', type=int)
+    if fixture_id is None or home_goals is None or away_goals is None:
+        flash('Enter the goals for both teams.', 'danger')
+        return redirect(url_for('admin_schedule'))
+    try:
+        schedule = schedule_file.update(lambda schedule: record_result(schedule, fixture_id, home_goals, away_goals))
+        # Every player's match-based rating moves with the result
+        home, away = fixture_members(schedule, fixture_id)
+        store.record_match(f"{schedule['id']}-{fixture_id}", home, away, home_goals, away_goals)
+    except ValueError as e:
+        flash(str(e), 'danger')
+    else:
+        flash(f'Result saved for match {fixture_id}.', 'success')
+    return redirect(url_for('admin_schedule', _anchor=f'match-{fixture_id}'))
+
+def describe_op(op):
+    """One-line description of a stored operation for the history page."""
+    kind = op['op']
+    if kind == 'batch':
+        return f"{len(op['ops'])} changes: " + '; '.join(describe_op(sub_op) for sub_op in op['ops'][:3]) + \
+            ('; ...' if len(op['ops']) > 3 else '')
+    if kind == 'add_participant':
+        return f"Added participant {op['name']}"
+    if kind in ('set_self_rating', 'update_participant_rating'):
+        return f"Self-rating of {op['name']} set to {op['rating']}"
+    if kind == 'remove_participant':
+        return f"Removed participant {op['name']} and their ratings"
+    if kind == 'add_ratings':
+        return f"{op['rater']} rated " + ', '.join(f'{rated_player} {rating}' for rated_player, rating in op['ratings'])
+    if kind == 'update_rating':
+        return f"Rating from {op['rater']} to {op['rated_player']} changed to {op['rating']}"
+    if kind == 'remove_rating':
+        return f"Removed the rating from {op['rater']} to {op['rated_player']}"
+    if kind == 'record_match':
+        return f"Match {op['match_id']}: {', '.join(op['home'])} {op['home_goals']} - {op['away_goals']} {', '.join(op['away'])}"
+    if kind == 'restore':
+        return f"Restored version {op['version']}"
+    if kind == 'reload':
+        return 'Data imported'
+    return 'Earliest version kept'
+
+# Admin route listing earlier versions of the data, with what restoring one would change (requires login)
+def admin_history():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    versions = [{
+        'seq': op['seq'],
+        'time': datetime.fromtimestamp(op['time']).strftime('%Y-%m-%d %H:%M:%S') if 'time' in op else '',
+        'description': describe_op(op),
+    } for op in reversed(store.versions()[-HISTORY_PAGE_SIZE:])]
+
+    selected = request.args.get('version', type=int)
+    diff = None
+    if selected is not None:
+        try:
+            diff = store.diff_version(selected)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('admin_history'))
+    return render_template('history.html', versions=versions, selected=selected, diff=diff,
+                           current=versions[0]['seq'] if versions else None)
+
+# Admin route to restore an earlier version; the restore itself becomes the newest version (requires login)
+def admin_history_restore():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    version = request.form.get('version', type=int)
+    if version is None:
+        flash('Choose a version to restore.', 'danger')
+        return redirect(url_for('admin_history'))
+    try:
+        store.restore(version)
+    except ValueError as e:
+        flash(str(e), 'danger')
+    else:
+        flash(f'Restored version {version}.', 'success')
+    return redirect(url_for('admin_history'))
+
+# Admin route to view per-route timing and I/O of this worker (requires login)
+def admin_metrics():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    if request.args.get('format') == 'prometheus':
+        return Response(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+    return render_template('metrics.html', routes=metrics.snapshot(), pid=os.getpid(),
+                           uptime=int(time.time() - metrics.started_at))
+
+# Route to add a new participant (requires login)
+def admin_add_participant():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    participant_name = request.form['participant_name'].strip()
+
+    if not participant_name:
+        flash('Participant name cannot be empty.', 'danger')
+        return redirect(url_for('admin'))
+
+    # Add new participant unless one with the same name already exists
+    if store.add_participant(participant_name):
+        flash('Participant added successfully.', 'success')
+    else:
+        flash('Participant already exists.', 'warning')
+
+    return redirect(url_for('admin'))
+
+# Route to bulk import participants or ratings from an uploaded CSV (requires login)
+def admin_bulk_import():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    upload = request.files.get('csv_file')
+    if not upload or not upload.filename:
+        flash('Choose a CSV file to import.', 'danger')
+        return redirect(url_for('admin'))
+
+    # Read the upload row by row straight from the request stream
+    participants = []
+    ratings = []
+    skipped = 0
+    try:
+        reader = csv.DictReader(io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''))
+        fields = {(field or '').strip().lower() for field in reader.fieldnames or []}
+        if {'rater', 'rated_player', 'rating'} <= fields:
+            kind = 'ratings'
+        elif 'name' in fields:
+            kind = 'participants'
+        else:
+            flash('CSV needs a name column (participants) or rater, rated_player and rating columns (ratings).', 'danger')
+            return redirect(url_for('admin'))
+
+        for row in reader:
+            row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items() if key}
+            if kind == 'participants':
+                if not row.get('name'):
+                    skipped += 1
+                    continue
+                participants.append((row['name'], parse_rating(row.get('rating'))))
+            else:
+                rating = parse_rating(row.get('rating'))
+                if not row.get('rater') or not row.get('rated_player') or rating is None:
+                    skipped += 1
+                    continue
+                ratings.append((row['rater'], row['rated_player'], rating))
+    except (UnicodeDecodeError, csv.Error) as e:
+        flash(f'Could not read the CSV file: {e}', 'danger')
+        return redirect(url_for('admin'))
+
+    # Merge everything in one atomic batch
+    summary = store.bulk_import(participants=participants, ratings=ratings)
+    if kind == 'participants':
+        flash(f"Imported participants: {summary['participants_added']} added, "
+              f"{summary['participants_updated']} updated, {skipped} rows skipped.", 'success')
+    else:
+        flash(f"Imported ratings: {summary['ratings_added']} added, "
+              f"{summary['ratings_updated']} updated, {skipped} rows skipped.", 'success')
+    return redirect(url_for('admin'))
+
+# Route to update participant ratings (requires login)
+def admin_update_participant_rating():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    participant_name = request.form['participant_name'].strip()
+    new_rating = request.form['rating'].strip()
+
+    if not new_rating:
+        flash('Rating cannot be empty.', 'danger')
+        return redirect(url_for('admin'))
+
+    try:
+        new_rating = int(float(new_rating))
+        if not (1 <= new_rating <= 5):
+            raise ValueError
+    except ValueError:
+        flash('Rating must be an integer between 1 and 5.', 'danger')
+        return redirect(url_for('admin'))
+
+    # Update participant rating in participants.csv
+    store.update_participant_rating(participant_name, new_rating)
+
+    flash('Participant rating updated successfully.', 'success')
+    return redirect(url_for('admin'))
+
+# Route to update ratings given by participants (requires login)
+def admin_update_given_ratings():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    rater = request.form['rater'].strip()
+    rated_player = request.form['rated_player'].strip()
+    new_rating = request.form['rating'].strip()
+
+    if not new_rating:
+        flash('Rating cannot be empty.', 'danger')
+        return redirect(url_for('admin'))
+
+    try:
+        new_rating = int(float(new_rating))
+        if not (1 <= new_rating <= 5):
+            raise ValueError
+    except ValueError:
+        flash('Rating must be an integer between 1 and 5.', 'danger')
+        return redirect(url_for('admin'))
+
+    # Update the rating in ratings.csv
+    if not store.update_rating(rater, rated_player, new_rating):
+        flash('Rating entry not found.', 'warning')
+        return redirect(url_for('admin'))
+
+    flash('Given rating updated successfully.', 'success')
+    return redirect(url_for('admin'))
+
+# Route to remove a participant (requires login)
+def admin_remove_participant():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    participant_name = request.form['participant_name'].strip()
+
+    # Remove participant from participants.csv and related ratings from ratings.csv
+    store.remove_participant(participant_name)
+
+    flash('Participant and related ratings removed successfully.', 'success')
+    return redirect(url_for('admin'))
+
+# Route to remove a rating (requires login)
+def admin_remove_rating():
+    if not session.get('admin_logged_in'):
+        return redirect(url_for('admin_login'))
+
+    rater = request.form['rater'].strip()
+    rated_player = request.form['rated_player'].strip()
+
+    # Remove rating from ratings.csv
+    if not store.remove_rating(rater, rated_player):
+        flash('Rating entry not found.', 'warning')
+        return redirect(url_for('admin'))
+
+    flash('Rating removed successfully.', 'success')
+    return redirect(url_for('admin'))
+
+# Route to logout admin
+def admin_logout():
+    session.pop('admin_logged_in', None)
+    flash('Logged out successfully.', 'success')
+    return redirect(url_for('admin_login'))
+
+def export_rows(kind, version):
+    """
+    Rows of one admin export, filtered by the request args. The stored rows are
+    shaped and filtered lazily while the response is written.
+    """
+    args = request.args
+    if kind == 'ratings':
+        rows, _ = store.query_ratings(rater=args.get('rater', '').strip(),
+                                      rated_player=args.get('rated_player', '').strip(),
+                                      rating=parse_rating(args.get('score', '')))
+        statistics = {normalize_name(player_stat['name']): player_stat
+                      for player_stat in calculate_ratings_statistics('raw', version)}
+        return rating_rows(rows, statistics)
+    if kind == 'matches':
+        return match_rows(store.match_rows(), player=args.get('player', ''))
+
+    scoring = args.get('scoring', 'raw')
+    if scoring not in SCORING_MODES:
+        scoring = 'raw'
+    team_size, team_method = team_options(args)
+    participants = {normalize_name(participant['name']): participant for participant in store.participant_rows()}
+    rows = player_rows(calculate_ratings_statistics(scoring, version), participants,
+                       generate_teams(team_size, team_method, scoring, version))
+    name = normalize_name(args.get('name', ''))
+    team = args.get('team', type=int)
+    min_count = args.get('min_count', type=int)
+    min_average = args.get('min_average', type=float)
+    max_average = args.get('max_average', type=float)
+    return (row for row in rows
+            if (not name or name in normalize_name(row['name']))
+            and (team is None or row['team'] == team)
+            and (min_count is None or row['count'] >= min_count)
+            and (min_average is None or (row['average'] is not None and row['average'] >= min_average))
+            and (max_average is None or (row['average'] is not None and row['average'] <= max_average)))
+
+# Admin route streaming players (with statistics and teams), ratings or match results
+# as CSV or JSON Lines, filtered by the query string (requires login)
+def admin_export(kind):
+    if not session.get('admin_logged_in'):
+        return Response(status=401)
+    if kind not in EXPORT_COLUMNS:
+        return Response(f'Unknown export: {kind}\n', status=404, mimetype='text/plain')
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return Response(f'Unknown format: {fmt}\n', status=400, mimetype='text/plain')
+    columns = [column for column in request.args.get('columns', '').split(',') if column] or EXPORT_COLUMNS[kind]
+    unknown = [column for column in columns if column not in EXPORT_COLUMNS[kind]]
+    if unknown:
+        return Response(f"Unknown columns: {', '.join(unknown)}\n", status=400, mimetype='text/plain')
+
+    version = store.data_version()
+    etag, last_modified = data_validators(version, request.path, request.query_string.decode('utf-8', 'replace'))
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+
+    offset = max(request.args.get('offset', 0, type=int) or 0, 0)
+    limit = request.args.get('limit', type=int)
+    rows = itertools.islice(export_rows(kind, version), offset,
+                            None if limit is None else offset + max(limit, 0))
+    response = Response(stream(rows, columns, fmt), mimetype=EXPORT_FORMATS[fmt],
+                        headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
+    return set_validators(response, etag, last_modified)
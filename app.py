@@ -1,149 +1,182 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, session, flash
-import csv
+from flask import Flask, Response, g, render_template, request, redirect, url_for, send_file, flash, get_template_attribute
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.http import is_resource_modified
+from werkzeug.utils import cached_property, import_string
+from datetime import datetime, timezone
+import hashlib
+import io
 import os
-import random
-from flask_wtf import FlaskForm
-from wtforms import PasswordField, SubmitField
-from wtforms.validators import DataRequired
-import statistics
-from collections import defaultdict
+from cache import VersionedCache
+from ingest import SubmissionWriter
+from metrics import metrics
+from scoring import blend
+from storage import RatingStore, parse_rating
+from teams import TEAM_STRATEGIES, assign_teams
 
-app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', os.urandom(24))  # Use environment variable for production
+SECRET_KEY = os.getenv('SECRET_KEY', os.urandom(24))  # Use environment variable for production
 
 # Admin password (use environment variables for security in production)
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'FC25Admin123')
 
-# Function to count ratings per participant
-def get_rating_counts():
-    ratings_counter = {}
-    if not os.path.exists('ratings.csv'):
-        # Create ratings.csv with headers if it doesn't exist
-        with open('ratings.csv', 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['rater', 'rated_player', 'rating']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-    with open('ratings.csv', 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            rated_player = row['rated_player'].strip().lower()  # Normalize to lowercase
-            if rated_player not in ratings_counter:
-                ratings_counter[rated_player] = 0
-            ratings_counter[rated_player] += 1
-    return ratings_counter
-
-# Flask-WTF form for admin login
-class AdminLoginForm(FlaskForm):
-    password = PasswordField('Password', validators=[DataRequired()])
-    submit = SubmitField('Login')
+# Directory holding participants.csv and ratings.csv
+DATA_DIR = os.getenv('DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# Journaled mode appends each edit to journal.jsonl and folds it into the CSVs every
+# JOURNAL_COMPACT_EVERY operations; STORAGE_JOURNAL=0 rewrites the CSVs on every edit
+STORAGE_JOURNAL = os.getenv('STORAGE_JOURNAL', '1') != '0'
+JOURNAL_COMPACT_EVERY = int(os.getenv('JOURNAL_COMPACT_EVERY', '1000'))
+# Rows per page in the admin ratings table
+RATINGS_PER_PAGE = int(os.getenv('RATINGS_PER_PAGE', '50'))
+
+# Seconds the players shown on a rate page stay reserved for that rater
+RESERVATION_TTL = int(os.getenv('RESERVATION_TTL', '600'))
+
+# Player strength used for ranking and teams: plain averages, or scores corrected for
+# harsh and generous raters (see scoring.py)
+SCORING_MODES = ('raw', 'adjusted')
+
+# How much match results (Elo) count against peer ratings once a player has played
+# enough matches; 0 ignores match results
+MATCH_WEIGHT = float(os.getenv('MATCH_WEIGHT', '0.5'))
+
+# Live admin updates: how often the event stream checks for new data, and how long one
+# stream stays open before the browser reconnects (kept below gunicorn's 30 s worker timeout)
+EVENT_POLL_INTERVAL = float(os.getenv('EVENT_POLL_INTERVAL', '1'))
+EVENT_STREAM_SECONDS = float(os.getenv('EVENT_STREAM_SECONDS', '25'))
+
+# Every change is kept in a history (history/ next to the CSVs, or inside the SQLite
+# database) so the admin can compare and restore earlier versions; STORAGE_HISTORY=0 turns it off
+STORAGE_HISTORY = os.getenv('STORAGE_HISTORY', '1') != '0'
+# Versions listed on the history page
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '200'))
+
+# STORAGE_BACKEND=sqlite keeps the data in SQLITE_PATH instead of the CSV files
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'csv')
+SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(DATA_DIR, 'fc25.db'))
+
+# Shared in-memory view of the rating data, reloaded only when it changes on disk
+if STORAGE_BACKEND == 'sqlite':
+    from sqlite_storage import SQLiteRatingStore
+    store = SQLiteRatingStore(SQLITE_PATH, reservation_ttl=RESERVATION_TTL, history=STORAGE_HISTORY)
+else:
+    store = RatingStore(DATA_DIR, journal=STORAGE_JOURNAL, compact_every=JOURNAL_COMPACT_EVERY,
+                        reservation_ttl=RESERVATION_TTL, history=STORAGE_HISTORY)
+
+# Rate-form submissions: 'sync' writes them in the request, 'group' batches concurrent
+# submissions into one fsync (only with a threaded worker class), 'async' acknowledges
+# before writing (see ingest.py)
+SUBMIT_DURABILITY = os.getenv('SUBMIT_DURABILITY', 'sync')
+submission_writer = SubmissionWriter(store, durability=SUBMIT_DURABILITY,
+                                     max_delay=float(os.getenv('SUBMIT_BATCH_DELAY', '0.05')))
+submission_writer.register_shutdown()
+
+# Tournament fixtures and results, shared by all workers
+SCHEDULE_FILE = os.getenv('SCHEDULE_FILE', os.path.join(DATA_DIR, 'schedule.json'))
+
+# Statistics, teams and rendered admin tables, recomputed only after the data changes
+page_cache = VersionedCache()
+
+# Part of every ETag, so a deploy with changed templates never gets a 304 for an old page
+TEMPLATES_VERSION = str(max(
+    (os.path.getmtime(os.path.join(root, file_name))
+     for root, _, file_names in os.walk(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'))
+     for file_name in file_names),
+    default=0
+))
+
+# Compiled templates are kept on disk (TEMPLATE_CACHE_DIR, or a per-user temporary directory)
+# and shared by all workers, so only the first one after a template change compiles it
+TEMPLATE_CACHE_DIR = os.getenv('TEMPLATE_CACHE_DIR') or None
+
+def cached(key, compute, version=None):
+    """
+    Memoizes compute() until the next write to the store.
 
-# Helper function to calculate ratings statistics
-def calculate_ratings_statistics():
-    participants = []
-    ratings_dict = defaultdict(list)
-
-    # Read participants and their self-ratings from participants.csv
-    if os.path.exists('participants.csv'):
-        with open('participants.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                name = row['name'].strip()
-                participants.append(name)
-                self_rating = row.get('rating', '').strip()
-                if self_rating and self_rating != '':
-                    try:
-                        rating_int = int(float(self_rating))  # Convert to int
-                        if 1 <= rating_int <= 5:
-                            ratings_dict[name.lower()].append(rating_int)
-                    except ValueError:
-                        pass  # Ignore invalid self-ratings
-
-    # Read ratings from ratings.csv
-    if os.path.exists('ratings.csv'):
-        with open('ratings.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                rated_player = row['rated_player'].strip().lower()
-                rating = row['rating'].strip()
-                if rated_player and rating:
-                    try:
-                        rating_int = int(float(rating))  # Convert to int
-                        if 1 <= rating_int <= 5:
-                            ratings_dict[rated_player].append(rating_int)
-                    except ValueError:
-                        pass  # Ignore invalid ratings
-
-    # Calculate statistics
-    statistics_list = []
-    for participant in participants:
-        ratings = ratings_dict.get(participant.lower(), [])
-        if ratings:
-            average = round(sum(ratings) / len(ratings), 2)
-            median = round(statistics.median(ratings), 2)
-            count = len(ratings)
-        else:
-            average = 'N/A'
-            median = 'N/A'
-            count = 0
-        statistics_list.append({
-            'name': participant,
-            'average': average,
-            'median': median,
-            'count': count
-        })
-
-    # Sort the list by average rating in descending order, handling 'N/A'
-    statistics_list_sorted = sorted(
-        statistics_list,
-        key=lambda x: (x['average'] if isinstance(x['average'], float) else -1),
-        reverse=True
-    )
-
-    return statistics_list_sorted
-
-# Helper function to assign teams of 2
-def assign_teams(participants):
+    :param key: What is being computed, including any parameters it depends on
+    :param version: Data version read once by the caller, so values computed together
+                    are filed under the same version even if a write lands in between
     """
-    Assigns participants into teams of 2, aiming for balanced total average ratings.
+    return page_cache.get(version or store.data_version(), key, compute)
+
+def render_fragment(macro_name, **kwargs):
+    # Renders one of the cacheable tables in admin_fragments.html
+    return get_template_attribute('admin_fragments.html', macro_name)(**kwargs)
 
-    :param participants: List of dictionaries with 'name' and 'average' keys
-    :return: List of teams, each team is a list of 2 participant names and combined average rating
+def data_validators(version, *parts):
     """
-    # Filter out participants without an average rating
-    rated_participants = [p for p in participants if isinstance(p['average'], float)]
-    unrated_participants = [p for p in participants if not isinstance(p['average'], float)]
-
-    # Sort participants by average rating descending
-    sorted_participants = sorted(rated_participants, key=lambda x: x['average'], reverse=True)
-
-    teams = []
-    while len(sorted_participants) >= 2:
-        high = sorted_participants.pop(0)  # Highest rated
-        low = sorted_participants.pop(-1)  # Lowest rated
-        combined_avg = round((high['average'] + low['average']) / 2, 2)  # Calculate combined average
-        teams.append({'members': [high['name'], low['name']], 'combined_avg': combined_avg})
-
-    # If there's an odd participant left, pair them randomly with an unrated participant
-    if sorted_participants and unrated_participants:
-        remaining = sorted_participants.pop(0)
-        random_unrated = unrated_participants.pop(0)
-        teams.append({'members': [remaining['name'], random_unrated], 'combined_avg': 'N/A'})
-    elif sorted_participants:
-        # If no unrated participants, pair the last two
-        if len(sorted_participants) >= 2:
-            team = [sorted_participants.pop(0)['name'], sorted_participants.pop(-1)['name']]
-            combined_avg = round(sum([p['average'] for p in team]) / 2, 2)
-            teams.append({'members': team, 'combined_avg': combined_avg})
-    elif unrated_participants:
-        # Pair remaining unrated participants randomly
-        while len(unrated_participants) >= 2:
-            team = [unrated_participants.pop(0), unrated_participants.pop(0)]
-            teams.append({'members': team, 'combined_avg': 'N/A'})
-
-    return teams
+    :return: Tuple of (ETag, Last-Modified) for a response built from this data version
+    """
+    version = '|'.join([version, TEMPLATES_VERSION] + [str(part) for part in parts])
+    etag = hashlib.sha1(version.encode('utf-8')).hexdigest()
+    return etag, datetime.fromtimestamp(store.last_modified(), timezone.utc)
+
+def set_validators(response, etag, last_modified):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True  # Browsers revalidate on every load
+    return response
+
+def not_modified(etag, last_modified):
+    """
+    :return: A 304 response if the client's cached copy is still current, otherwise None
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return set_validators(Response(status=304), etag, last_modified)
+
+# Per-request timing and storage I/O, reported on /admin/metrics
+def start_request_metrics():
+    g.metrics_token = metrics.start()
+
+def finish_request_metrics(response):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        route = f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}"
+        if response.direct_passthrough:
+            # File responses are handed to the server as-is and never call close hooks
+            metrics.finish(route, token)
+        else:
+            # Recorded when the response is closed, so streamed pages are timed to the last byte
+            response.call_on_close(lambda: metrics.finish(route, token))
+    return response
+
+# Helper function to calculate ratings statistics
+def calculate_ratings_statistics(scoring='raw', version=None):
+    # Per-player aggregates are maintained incrementally by the store; the rater-bias
+    # corrected 'adjusted' scores are fitted on top of them. Both are memoized until the next write.
+    version = version or store.data_version()
+    statistics_list = cached(('player_statistics',), lambda: store.player_statistics(adjusted=True), version)
+    peer_key = 'adjusted' if scoring == 'adjusted' else 'average'
+
+    def rank():
+        # 'strength' blends the chosen peer score with the match-based Elo rating
+        ranked = [dict(player_stat, strength=blend(player_stat[peer_key], player_stat['elo'],
+                                                   player_stat['matches'], MATCH_WEIGHT))
+                  for player_stat in statistics_list]
+        # Sort the list by strength in descending order, handling 'N/A'
+        return sorted(ranked, key=lambda x: (x['strength'] if isinstance(x['strength'], float) else -1), reverse=True)
+
+    return cached(('ratings_statistics', peer_key), rank, version)
+
+def team_options(values):
+    """Team size and pairing method from request args or form values, with defaults."""
+    team_size = values.get('team_size', 2, type=int)
+    if not team_size or team_size < 1:
+        team_size = 2
+    team_method = values.get('team_method', 'balanced')
+    if team_method not in TEAM_STRATEGIES:
+        team_method = 'balanced'
+    return team_size, team_method
+
+def generate_teams(team_size, team_method, scoring='raw', version=None):
+    # Teams as shown on the admin page, memoized until the next write
+    version = version or store.data_version()
+    ratings_statistics = calculate_ratings_statistics(scoring, version)
+    team_pool = [dict(player_stat, average=player_stat['strength']) for player_stat in ratings_statistics]
+    return cached(('teams', team_size, team_method, scoring),
+                  lambda: assign_teams(team_pool, team_size=team_size, method=team_method), version)
 
 # Route to enter name and proceed to rate others
-@app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
         # Get the name and redirect to the rate page
@@ -155,7 +188,6 @@ def index():
     return render_template('index.html')
 
 # Route to display the form with 5 random participants, excluding the current user
-@app.route('/rate/<self_name>', methods=['GET', 'POST'])
 def rate(self_name):
     if request.method == 'POST':
         # Handle rating submission
@@ -171,360 +203,146 @@ def rate(self_name):
             flash('Self rating must be an integer between 1 and 5.', 'danger')
             return redirect(url_for('rate', self_name=self_name))
 
-        # Update or add the self-rating in `participants.csv`
-        participants = []
-        if os.path.exists('participants.csv'):
-            with open('participants.csv', 'r', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    participants.append(row)
-
-        updated = False
-        with open('participants.csv', 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['name', 'rating']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for participant in participants:
-                if participant['name'].strip().lower() == self_name:
-                    writer.writerow({'name': participant['name'], 'rating': self_rating})
-                    updated = True
-                else:
-                    writer.writerow(participant)
-            if not updated:
-                writer.writerow({'name': self_name, 'rating': self_rating})
-
-        # Save the ratings for the 5 random participants in `ratings.csv`
-        with open('ratings.csv', 'a', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['rater', 'rated_player', 'rating']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            # If the file was just created, write headers
-            if os.stat('ratings.csv').st_size == 0:
-                writer.writeheader()
-            for i in range(1, 6):
-                random_player = request.form.get(f'random_player_{i}', '').strip()
-                random_rating = request.form.get(f'rating_{i}', '').strip()
-                if random_player and random_rating:
-                    try:
-                        random_rating_int = int(float(random_rating))
-                        if 1 <= random_rating_int <= 5:
-                            writer.writerow({
-                                'rater': self_name,
-                                'rated_player': random_player,
-                                'rating': random_rating_int
-                            })
-                    except ValueError:
-                        pass  # Ignore invalid ratings
+        # The self-rating and the ratings for the 5 random participants are stored
+        # together, right away or by the background writer (see SUBMIT_DURABILITY)
+        given_ratings = []
+        for i in range(1, 6):
+            random_player = request.form.get(f'random_player_{i}', '').strip()
+            random_rating = parse_rating(request.form.get(f'rating_{i}', ''))
+            if random_player and random_rating is not None:
+                given_ratings.append((random_player, random_rating))
+        submission_writer.submit(self_name, self_rating, given_ratings)
+        store.release_reservation(self_name)
 
         return redirect(url_for('thank_you'))
 
-    # If GET request, display the rating form
-    participants = []
-    ratings_counter = get_rating_counts()
-
-    # Read participants from CSV and filter out the current user
-    if os.path.exists('participants.csv'):
-        with open('participants.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['name'].strip().lower() != self_name:
-                    participants.append(row['name'].strip())
-
-    # Sort participants by how often they've been rated (ascending)
-    sorted_participants = sorted(participants, key=lambda x: ratings_counter.get(x.lower(), 0))
-
-    # Choose the 5 participants who have been rated the least (if there are at least 5)
-    random_participants = sorted_participants[:5] if len(sorted_participants) >= 5 else sorted_participants
+    # If GET request, display the rating form with the 5 participants who have been
+    # rated the least (ties broken randomly), reserving them for this rater
+    random_participants = store.pick_least_rated(self_name, 5)
 
     return render_template('rate.html', random_participants=random_participants, self_name=self_name)
 
 # Route to display a "Thank You" page after submission
-@app.route('/thank_you')
 def thank_you():
     return render_template('thank_you.html')
 
-# Admin login route
-@app.route('/admin/login', methods=['GET', 'POST'])
-def admin_login():
-    form = AdminLoginForm()
-    if form.validate_on_submit():
-        if form.password.data.strip() == ADMIN_PASSWORD:
-            session['admin_logged_in'] = True
-            flash('Logged in successfully.', 'success')
-            return redirect(url_for('admin'))
-        else:
-            flash('Incorrect password. Please try again.', 'danger')
-    return render_template('admin_login.html', form=form)
-
-# Admin route to view participants and ratings (requires login)
-@app.route('/admin')
-def admin():
-    if not session.get('admin_logged_in'):
-        return redirect(url_for('admin_login'))
-
-    participants = []
-    ratings = []
-
-    # Read participants from the CSV file
-    if os.path.exists('participants.csv'):
-        with open('participants.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                participants.append(row)
-
-    # Read ratings from the CSV file
-    if os.path.exists('ratings.csv'):
-        with open('ratings.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                ratings.append(row)
-
-    # Calculate ratings statistics
-    ratings_statistics = calculate_ratings_statistics()
-
-    # Assign teams of 2
-    teams = assign_teams(ratings_statistics)  # Teams will be pairs of 2
-
-    return render_template(
-        'admin.html',
-        participants=participants,
-        ratings=ratings,
-        ratings_statistics=ratings_statistics,  # Pass the statistics to the template
-        teams=teams  # Pass the generated teams to the template
-    )
-
-# Route to add a new participant (requires login)
-@app.route('/admin/add_participant', methods=['POST'])
-def admin_add_participant():
-    if not session.get('admin_logged_in'):
-        return redirect(url_for('admin_login'))
-
-    participant_name = request.form['participant_name'].strip()
-
-    if not participant_name:
-        flash('Participant name cannot be empty.', 'danger')
-        return redirect(url_for('admin'))
-
-    # Check if participant already exists
-    participant_exists = False
-    if os.path.exists('participants.csv'):
-        with open('participants.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['name'].strip().lower() == participant_name.lower():
-                    participant_exists = True
-                    break
-
-    if participant_exists:
-        flash('Participant already exists.', 'warning')
-    else:
-        # Add new participant to participants.csv
-        with open('participants.csv', 'a', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['name', 'rating']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            # If the file was just created, write headers
-            if os.stat('participants.csv').st_size == 0:
-                writer.writeheader()
-            writer.writerow({'name': participant_name, 'rating': ''})
-        flash('Participant added successfully.', 'success')
-
-    return redirect(url_for('admin'))
-
-# Route to update participant ratings (requires login)
-@app.route('/admin/update_participant_rating', methods=['POST'])
-def admin_update_participant_rating():
-    if not session.get('admin_logged_in'):
-        return redirect(url_for('admin_login'))
-
-    participant_name = request.form['participant_name'].strip()
-    new_rating = request.form['rating'].strip()
-
-    if not new_rating:
-        flash('Rating cannot be empty.', 'danger')
-        return redirect(url_for('admin'))
-
-    try:
-        new_rating = int(float(new_rating))
-        if not (1 <= new_rating <= 5):
-            raise ValueError
-    except ValueError:
-        flash('Rating must be an integer between 1 and 5.', 'danger')
-        return redirect(url_for('admin'))
-
-    # Update participant rating in participants.csv
-    participants = []
-    if os.path.exists('participants.csv'):
-        with open('participants.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['name'].strip().lower() == participant_name.lower():
-                    row['rating'] = new_rating
-                participants.append(row)
-
-    # Write back to participants.csv
-    with open('participants.csv', 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['name', 'rating']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for participant in participants:
-            writer.writerow(participant)
-
-    flash('Participant rating updated successfully.', 'success')
-    return redirect(url_for('admin'))
-
-# Route to update ratings given by participants (requires login)
-@app.route('/admin/update_given_ratings', methods=['POST'])
-def admin_update_given_ratings():
-    if not session.get('admin_logged_in'):
-        return redirect(url_for('admin_login'))
-
-    rater = request.form['rater'].strip()
-    rated_player = request.form['rated_player'].strip()
-    new_rating = request.form['rating'].strip()
-
-    if not new_rating:
-        flash('Rating cannot be empty.', 'danger')
-        return redirect(url_for('admin'))
-
-    try:
-        new_rating = int(float(new_rating))
-        if not (1 <= new_rating <= 5):
-            raise ValueError
-    except ValueError:
-        flash('Rating must be an integer between 1 and 5.', 'danger')
-        return redirect(url_for('admin'))
-
-    # Update the rating in ratings.csv
-    ratings = []
-    rating_found = False
-    if os.path.exists('ratings.csv'):
-        with open('ratings.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['rater'].strip().lower() == rater.lower() and row['rated_player'].strip().lower() == rated_player.lower():
-                    row['rating'] = new_rating
-                    rating_found = True
-                ratings.append(row)
-
-    if not rating_found:
-        flash('Rating entry not found.', 'warning')
-        return redirect(url_for('admin'))
-
-    # Write back to ratings.csv
-    with open('ratings.csv', 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['rater', 'rated_player', 'rating']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for rating in ratings:
-            writer.writerow(rating)
-
-    flash('Given rating updated successfully.', 'success')
-    return redirect(url_for('admin'))
-
-# Route to remove a participant (requires login)
-@app.route('/admin/remove_participant', methods=['POST'])
-def admin_remove_participant():
-    if not session.get('admin_logged_in'):
-        return redirect(url_for('admin_login'))
-
-    participant_name = request.form['participant_name'].strip()
-
-    # Remove participant from participants.csv
-    participants = []
-    if os.path.exists('participants.csv'):
-        with open('participants.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['name'].strip().lower() != participant_name.lower():
-                    participants.append(row)
-
-    # Write back to participants.csv
-    with open('participants.csv', 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['name', 'rating']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for participant in participants:
-            writer.writerow(participant)
-
-    # Remove related ratings from ratings.csv
-    ratings = []
-    if os.path.exists('ratings.csv'):
-        with open('ratings.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['rater'].strip().lower() != participant_name.lower() and row['rated_player'].strip().lower() != participant_name.lower():
-                    ratings.append(row)
-
-    # Write back to ratings.csv
-    with open('ratings.csv', 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['rater', 'rated_player', 'rating']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for rating in ratings:
-            writer.writerow(rating)
-
-    flash('Participant and related ratings removed successfully.', 'success')
-    return redirect(url_for('admin'))
-
-# Route to remove a rating (requires login)
-@app.route('/admin/remove_rating', methods=['POST'])
-def admin_remove_rating():
-    if not session.get('admin_logged_in'):
-        return redirect(url_for('admin_login'))
-
-    rater = request.form['rater'].strip()
-    rated_player = request.form['rated_player'].strip()
-
-    # Remove rating from ratings.csv
-    ratings = []
-    rating_found = False
-    if os.path.exists('ratings.csv'):
-        with open('ratings.csv', 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row['rater'].strip().lower() == rater.lower() and row['rated_player'].strip().lower() == rated_player.lower():
-                    rating_found = True
-                    continue  # Skip this row to remove it
-                ratings.append(row)
-
-    if not rating_found:
-        flash('Rating entry not found.', 'warning')
-        return redirect(url_for('admin'))
-
-    # Write back to ratings.csv
-    with open('ratings.csv', 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['rater', 'rated_player', 'rating']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for rating in ratings:
-            writer.writerow(rating)
-
-    flash('Rating removed successfully.', 'success')
-    return redirect(url_for('admin'))
-
-# Route to logout admin
-@app.route('/admin/logout')
-def admin_logout():
-    session.pop('admin_logged_in', None)
-    flash('Logged out successfully.', 'success')
-    return redirect(url_for('admin_login'))
+def csv_download(kind):
+    # Serialized from the store so journaled edits and the SQLite backend are included;
+    # unchanged data is answered with 304 Not Modified
+    version = store.data_version()
+    etag, last_modified = data_validators(version, kind)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    data = cached(('csv', kind), lambda: store.export_csv(kind), version)
+    response = send_file(io.BytesIO(data), mimetype='text/csv', as_attachment=True,
+                         download_name=f'{kind}.csv', etag=etag, last_modified=last_modified)
+    response.cache_control.no_cache = True
+    return response
 
 # Route to download participants.csv
-@app.route('/download_participants')
 def download_participants():
-    if os.path.exists('participants.csv'):
-        return send_file('participants.csv', as_attachment=True)
-    else:
-        flash('Participants file not found.', 'danger')
-        return redirect(url_for('admin'))
+    return csv_download('participants')
 
 # Route to download ratings.csv
-@app.route('/download_ratings')
 def download_ratings():
-    if os.path.exists('ratings.csv'):
-        return send_file('ratings.csv', as_attachment=True)
-    else:
-        flash('Ratings file not found.', 'danger')
-        return redirect(url_for('admin'))
+    return csv_download('ratings')
+
+# Route to download matches.csv
+def download_matches():
+    return csv_download('matches')
+
+# CLI command to import participants.csv / ratings.csv into the SQLite backend
+def import_csv_command():
+    """Replace the SQLite data with the CSV files in DATA_DIR."""
+    from sqlite_storage import SQLiteRatingStore
+    target = store if isinstance(store, SQLiteRatingStore) else SQLiteRatingStore(SQLITE_PATH)
+    participant_count, rating_count = target.import_csv(DATA_DIR)
+    print(f'Imported {participant_count} participants and {rating_count} ratings into {target.db_path}')
+
+class LazyView:
+    """
+    View function imported from its module on the first request it serves, so a worker
+    only loads the admin pages (and Flask-WTF, the scheduler and the exports with them)
+    once someone uses them.
+    """
+
+    def __init__(self, import_name):
+        self.import_name = import_name
+
+    @cached_property
+    def view(self):
+        return import_string(self.import_name)
+
+    def __call__(self, *args, **kwargs):
+        return self.view(*args, **kwargs)
+
+# Pages for players and the CSV downloads: (rule, view, methods)
+PUBLIC_ROUTES = [
+    ('/', index, ['GET', 'POST']),
+    ('/rate/<self_name>', rate, ['GET', 'POST']),
+    ('/thank_you', thank_you, ['GET']),
+    ('/download_participants', download_participants, ['GET']),
+    ('/download_ratings', download_ratings, ['GET']),
+    ('/download_matches', download_matches, ['GET']),
+]
+
+# Admin pages in admin_views.py, loaded lazily: (rule, endpoint, methods)
+ADMIN_ROUTES = [
+    ('/admin/login', 'admin_login', ['GET', 'POST']),
+    ('/admin', 'admin', ['GET']),
+    ('/admin/events', 'admin_events', ['GET']),
+    ('/admin/schedule', 'admin_schedule', ['GET', 'POST']),
+    ('/admin/schedule/result', 'admin_schedule_result', ['POST']),
+    ('/admin/history', 'admin_history', ['GET']),
+    ('/admin/history/restore', 'admin_history_restore', ['POST']),
+    ('/admin/metrics', 'admin_metrics', ['GET']),
+    ('/admin/add_participant', 'admin_add_participant', ['POST']),
+    ('/admin/bulk_import', 'admin_bulk_import', ['POST']),
+    ('/admin/update_participant_rating', 'admin_update_participant_rating', ['POST']),
+    ('/admin/update_given_ratings', 'admin_update_given_ratings', ['POST']),
+    ('/admin/remove_participant', 'admin_remove_participant', ['POST']),
+    ('/admin/remove_rating', 'admin_remove_rating', ['POST']),
+    ('/admin/logout', 'admin_logout', ['GET']),
+    ('/admin/export/<kind>', 'admin_export', ['GET']),
+]
+
+def create_app():
+    """
+    Builds the Flask app. The shared store, caches and submission writer are created
+    once per process at import, so every app built here serves the same data.
+    """
+    app = Flask(__name__)
+    app.secret_key = SECRET_KEY
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    app.before_request(start_request_metrics)
+    app.after_request(finish_request_metrics)
+    for rule, view, methods in PUBLIC_ROUTES:
+        app.add_url_rule(rule, view_func=view, methods=methods)
+    for rule, endpoint, methods in ADMIN_ROUTES:
+        app.add_url_rule(rule, endpoint, LazyView(f'admin_views.{endpoint}'), methods=methods)
+    app.cli.command('import-csv')(import_csv_command)
+    return app
+
+app = create_app()
+
+def warm_up():
+    """
+    Does the work of a worker's first requests ahead of time: loads the data and its
+    indexes, compiles every template and renders the default admin tables.
+    Called from gunicorn's post_worker_init hook (see gunicorn.conf.py).
+    """
+    store.refresh()
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+    # The tables link to admin routes, so they are rendered as for a request to /admin
+    from admin_views import admin_tables
+    with app.test_request_context('/admin'):
+        for render_table in admin_tables(store.data_version(), 'raw', *team_options(request.args)):
+            render_table()
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    # Served as the module 'app', the name admin_views.py imports the shared store and
+    # helpers from, so the development server does not load them twice
+    import app as app_module
+    app_module.app.run(host='0.0.0.0', port=5001, debug=True)
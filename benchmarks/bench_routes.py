@@ -0,0 +1,214 @@
+"""
+Benchmark harness for every Flask route.
+
+Generates synthetic participants.csv / ratings.csv files of increasing size, drives each
+route through Flask's test client and records latency percentiles and throughput per
+route and size. Results are appended as JSON lines to --output; pass --compare with an
+earlier results file to flag routes that got slower.
+
+Usage:
+    python benchmarks/bench_routes.py [--sizes 30 1000 10000 100000] [--requests 50]
+                                      [--backend csv|sqlite] [--output benchmarks/results.jsonl]
+                                      [--compare old_results.jsonl] [--tolerance 0.25]
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import admin_views  # noqa: E402
+import app as app_module  # noqa: E402
+from ingest import SubmissionWriter  # noqa: E402
+from sqlite_storage import SQLiteRatingStore  # noqa: E402
+from storage import RatingStore  # noqa: E402
+
+
+def generate_data(data_dir, rating_rows, seed=25):
+    """Writes synthetic CSVs with rating_rows ratings; returns the participant names."""
+    rng = random.Random(seed)
+    participant_count = min(max(rating_rows // 5, 10), 5000)
+    names = [f'Player {i}' for i in range(participant_count)]
+    with open(os.path.join(data_dir, 'participants.csv'), 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=['name', 'rating'])
+        writer.writeheader()
+        for name in names:
+            writer.writerow({'name': name, 'rating': rng.choice(['', 1, 2, 3, 4, 5])})
+    with open(os.path.join(data_dir, 'ratings.csv'), 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=['rater', 'rated_player', 'rating'])
+        writer.writeheader()
+        for _ in range(rating_rows):
+            rater, rated = rng.sample(names, 2)
+            writer.writerow({'rater': rater.lower(), 'rated_player': rated, 'rating': rng.randint(1, 5)})
+    return names
+
+
+def make_store(backend, data_dir):
+    if backend == 'sqlite':
+        store = SQLiteRatingStore(os.path.join(data_dir, 'bench.db'))
+        store.import_csv(data_dir)
+        return store
+    return RatingStore(data_dir)
+
+
+def route_cases(names, rng):
+    """(label, method, url, form factory) for every route; factories get the iteration number."""
+    def rate_form(i):
+        form = {'self_rating': str(i % 5 + 1)}
+        for slot, name in enumerate(rng.sample(names, 5), start=1):
+            form[f'random_player_{slot}'] = name
+            form[f'rating_{slot}'] = str(rng.randint(1, 5))
+        return form
+
+    return [
+        ('GET /', 'get', lambda i: '/', None),
+        ('POST /', 'post', lambda i: '/', lambda i: {'self_name': names[i % len(names)]}),
+        ('GET /rate/<self_name>', 'get', lambda i: f'/rate/{names[i % len(names)].lower()}', None),
+        ('POST /rate/<self_name>', 'post', lambda i: f'/rate/bench rater {i}', rate_form),
+        ('GET /thank_you', 'get', lambda i: '/thank_you', None),
+        ('GET /admin', 'get', lambda i: '/admin', None),
+        ('GET /admin?rated_player=', 'get', lambda i: f'/admin?rated_player={names[i % len(names)]}', None),
+        ('GET /admin?page=last', 'get', lambda i: '/admin?page=1000000', None),
+        ('POST /admin/add_participant', 'post', lambda i: '/admin/add_participant',
+         lambda i: {'participant_name': f'Bench Added {i}'}),
+        ('POST /admin/update_participant_rating', 'post', lambda i: '/admin/update_participant_rating',
+         lambda i: {'participant_name': names[i % len(names)], 'rating': str(i % 5 + 1)}),
+        ('POST /admin/update_given_ratings', 'post', lambda i: '/admin/update_given_ratings',
+         lambda i: {'rater': f'bench rater {i}', 'rated_player': names[0], 'rating': '3'}),
+        ('POST /admin/remove_rating', 'post', lambda i: '/admin/remove_rating',
+         lambda i: {'rater': f'bench rater {i}', 'rated_player': names[0]}),
+        ('POST /admin/remove_participant', 'post', lambda i: '/admin/remove_participant',
+         lambda i: {'participant_name': f'Bench Added {i}'}),
+        ('GET /download_participants', 'get', lambda i: '/download_participants', None),
+        ('GET /download_ratings', 'get', lambda i: '/download_ratings', None),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(label, size, timings, extra):
+    timings = sorted(timings)
+    total = sum(timings)
+    return dict(extra, route=label, size=size, requests=len(timings),
+                p50_ms=round(percentile(timings, 0.50) * 1000, 3),
+                p90_ms=round(percentile(timings, 0.90) * 1000, 3),
+                p99_ms=round(percentile(timings, 0.99) * 1000, 3),
+                mean_ms=round(statistics.mean(timings) * 1000, 3),
+                throughput_rps=round(len(timings) / total, 1) if total else None)
+
+
+def bench_size(size, args, extra):
+    data_dir = tempfile.mkdtemp(prefix=f'fc25-bench-{size}-')
+    names = generate_data(data_dir, size)
+    app_module.store = make_store(args.backend, data_dir)
+    # The rate form submits through the writer, which would otherwise still write to the
+    # store the app was imported with (DATA_DIR, usually the repository's own CSVs)
+    app_module.submission_writer = SubmissionWriter(app_module.store)
+    admin_views.store = app_module.store  # Admin pages import the store by name
+    app_module.app.config['WTF_CSRF_ENABLED'] = False
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+
+    results = []
+    start = time.perf_counter()
+    app_module.store.refresh()
+    results.append(summarize('store load', size, [time.perf_counter() - start], extra))
+
+    rng = random.Random(size)
+    for label, method, url, form in route_cases(names, rng):
+        timings = []
+        for i in range(args.requests):
+            kwargs = {'data': form(i)} if form else {}
+            start = time.perf_counter()
+            response = getattr(client, method)(url(i), **kwargs)
+            response.get_data()  # Drain streamed responses
+            timings.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{label} returned {response.status_code}')
+        results.append(summarize(label, size, timings, extra))
+
+    for label, func in (('calculate_ratings_statistics()', app_module.calculate_ratings_statistics),
+                        ('assign_teams()', lambda: app_module.assign_teams(app_module.calculate_ratings_statistics()))):
+        timings = []
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        results.append(summarize(label, size, timings, extra))
+    return results
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(results, baseline, tolerance):
+    """Prints routes whose p50 got more than `tolerance` slower than in the baseline rows."""
+    latest = {}
+    for row in baseline:
+        latest[(row['backend'], row['route'], row['size'])] = row  # Latest run wins
+    regressions = []
+    for row in results:
+        old = latest.get((row['backend'], row['route'], row['size']))
+        if old and old['p50_ms'] and row['p50_ms'] > old['p50_ms'] * (1 + tolerance):
+            regressions.append((row, old))
+    for row, old in regressions:
+        print(f'REGRESSION {row["route"]} @ {row["size"]}: p50 {old["p50_ms"]} ms -> {row["p50_ms"]} ms')
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[30, 1000, 10000, 100000],
+                        help='Number of rows in ratings.csv')
+    parser.add_argument('--requests', type=int, default=50, help='Requests per route and size')
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], default='csv')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results.jsonl'))
+    parser.add_argument('--compare', help='Earlier results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p50 slowdown (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    # Read the baseline first, since --compare may point at the --output file
+    baseline = load_results(args.compare) if args.compare else None
+
+    extra = {'backend': args.backend, 'revision': git_revision(), 'timestamp': int(time.time())}
+    results = []
+    print(f'{"route":<40} {"size":>7} {"p50 ms":>9} {"p90 ms":>9} {"p99 ms":>9} {"req/s":>9}')
+    for size in args.sizes:
+        for row in bench_size(size, args, extra):
+            results.append(row)
+            print(f'{row["route"]:<40} {size:>7} {row["p50_ms"]:>9.2f} {row["p90_ms"]:>9.2f} '
+                  f'{row["p99_ms"]:>9.2f} {row["throughput_rps"] or 0:>9.1f}', flush=True)
+
+    with open(args.output, 'a', encoding='utf-8') as f:
+        for row in results:
+            f.write(json.dumps(row) + '\n')
+    print(f'Results appended to {args.output}')
+
+    if baseline is not None and compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Cold-start benchmark for a worker.
+
+Starts fresh Python processes the way gunicorn starts a worker: import the app, optionally
+run the warm-up from gunicorn.conf.py, then serve the first requests. Reports the median
+import time, warm-up time and first-request latency per route, with and without warm-up,
+for an empty and for a filled template bytecode cache. --profile also lists the slowest
+imports (python -X importtime).
+
+Usage: python benchmarks/bench_startup.py [--ratings 10000] [--runs 5] [--profile]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Requests a worker typically gets first; /admin is requested logged in
+FIRST_REQUESTS = ['/', '/rate/player 0', '/admin/login', '/admin']
+
+
+def child(warm_up):
+    # One simulated worker; prints its timings as JSON
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    import app as app_module
+    timings = {'import': time.perf_counter() - start, 'warm_up': 0.0}
+    if warm_up:
+        start = time.perf_counter()
+        app_module.warm_up()
+        timings['warm_up'] = time.perf_counter() - start
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    for path in FIRST_REQUESTS:
+        start = time.perf_counter()
+        response = client.get(path)
+        response.get_data()  # Streamed pages are only rendered while being read
+        timings[path] = time.perf_counter() - start
+    print(json.dumps(timings))
+
+
+def run_workers(data_dir, cache_dir, warm_up, runs):
+    # Without a cache_dir every worker gets an empty template cache of its own
+    results = []
+    for _ in range(runs):
+        env = dict(os.environ, DATA_DIR=data_dir,
+                   TEMPLATE_CACHE_DIR=cache_dir or tempfile.mkdtemp(prefix='fc25-jinja-'))
+        output = subprocess.run([sys.executable, __file__, '--child'] + (['--warm-up'] if warm_up else []),
+                                env=env, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(result[key] for result in results) for key in results[0]}
+
+
+def profile_imports(data_dir, top):
+    env = dict(os.environ, DATA_DIR=data_dir)
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=env,
+                            check=True, capture_output=True, text=True).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if self_us.strip().isdigit():  # Skips the header line
+            imports.append((int(cumulative_us), int(self_us), name.strip()))
+    print('Slowest imports (cumulative / self, ms):')
+    for cumulative_us, self_us, name in sorted(imports, reverse=True)[:top]:
+        print(f'  {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {name}')
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ratings', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--profile', action='store_true', help='List the slowest imports first')
+    parser.add_argument('--top', type=int, default=20, help='Imports listed by --profile')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--warm-up', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.warm_up)
+        return
+
+    # Imported here: bench_routes imports the app, which the children have to time themselves
+    from bench_routes import generate_data
+    data_dir = tempfile.mkdtemp(prefix='fc25-startup-')
+    generate_data(data_dir, args.ratings)
+    if args.profile:
+        profile_imports(data_dir, args.top)
+
+    columns = ['import', 'warm_up'] + FIRST_REQUESTS
+    print(f"{'worker':<28}" + ''.join(f'{column:>15}' for column in columns) + f"{'ready + first':>15}")
+    for warm_up in (False, True):
+        for cache in ('empty', 'filled'):
+            cache_dir = None
+            if cache == 'filled':
+                cache_dir = tempfile.mkdtemp(prefix='fc25-jinja-')
+                run_workers(data_dir, cache_dir, warm_up, 1)  # An earlier worker compiled the templates
+            timings = run_workers(data_dir, cache_dir, warm_up, args.runs)
+            # What scaling out costs until the worker has answered all first requests
+            total = sum(timings.values())
+            label = f"{'warm-up' if warm_up else 'no warm-up'}, {cache} template cache"
+            print(f'{label:<28}' + ''.join(f'{timings[column] * 1000:13.1f}ms' for column in columns) +
+                  f'{total * 1000:13.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Compares the team-balancing strategies in teams.py on synthetic players.
+
+For each player count it reports, per strategy, the spread between the strongest and the
+weakest team average, the standard deviation of team averages and the runtime.
+
+Usage: python benchmarks/bench_teams.py [--sizes 10 30 100 300] [--team-size 2] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from teams import TEAM_STRATEGIES, assign_teams  # noqa: E402
+
+
+def synthetic_players(count, rng, unrated_share=0.1):
+    players = []
+    for i in range(count):
+        if rng.random() < unrated_share:
+            average = 'N/A'
+        else:
+            average = round(min(5.0, max(1.0, rng.gauss(3.0, 1.0))), 2)
+        players.append({'name': f'Player {i}', 'average': average, 'median': average, 'count': 1})
+    return players
+
+
+def team_quality(teams, players):
+    # Score every team on the same scale: unrated players count as the rated mean
+    rated = [p['average'] for p in players if isinstance(p['average'], float)]
+    default = sum(rated) / len(rated)
+    strength = {p['name']: p['average'] if isinstance(p['average'], float) else default for p in players}
+    averages = [sum(strength[m] for m in team['members']) / len(team['members']) for team in teams]
+    placed = sum(len(team['members']) for team in teams)
+    return max(averages) - min(averages), statistics.pstdev(averages), placed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 31, 100, 301])
+    parser.add_argument('--team-size', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=25)
+    args = parser.parse_args()
+
+    print(f'{"players":>8} {"method":>10} {"spread":>8} {"stdev":>8} {"placed":>8} {"ms":>9}')
+    for size in args.sizes:
+        for method in sorted(TEAM_STRATEGIES):
+            rng = random.Random(args.seed)
+            spreads, stdevs, placed, elapsed = [], [], [], []
+            for _ in range(args.repeat):
+                players = synthetic_players(size, rng)
+                start = time.perf_counter()
+                teams = assign_teams(players, team_size=args.team_size, method=method)
+                elapsed.append(time.perf_counter() - start)
+                spread, stdev, count = team_quality(teams, players)
+                spreads.append(spread)
+                stdevs.append(stdev)
+                placed.append(count)
+            print(f'{size:>8} {method:>10} {statistics.mean(spreads):>8.3f} {statistics.mean(stdevs):>8.3f} '
+                  f'{statistics.mean(placed):>8.1f} {statistics.mean(elapsed) * 1000:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+Concurrent submission load test.
+
+Starts many processes (each with its own copy of the app, like gunicorn workers) that all
+submit the rate form at the same moment against a shared data directory, then checks that
+no self-rating or given rating was lost.
+
+With --threads the submitters are threads of one process instead, like the threads of a
+gthread worker, and --readers more threads keep loading the admin page, exports and
+downloads meanwhile; any failed read is reported as an error.
+
+Usage: python benchmarks/load_test.py [--submitters 200] [--participants 50] [--durability sync]
+                                      [--threads] [--readers 4]
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Pages the --readers threads load over and over while submissions are written
+READ_PATHS = ['/admin', '/admin?scoring=adjusted', '/admin/export/players', '/admin/export/ratings?format=jsonl',
+              '/download_ratings']
+
+
+def write_participants(data_dir, count):
+    with open(os.path.join(data_dir, 'participants.csv'), 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=['name', 'rating'])
+        writer.writeheader()
+        for i in range(count):
+            writer.writerow({'name': f'Player {i}', 'rating': ''})
+
+
+def submit(index, barrier, results, flush=True):
+    # Imported here so every process builds its own app and store, like a gunicorn worker
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    client = app_module.app.test_client()
+    self_name = f'submitter {index}'
+    form = {'self_rating': str(index % 5 + 1)}
+    for i in range(1, 6):
+        form[f'random_player_{i}'] = f'Player {(index + i) % 50}'
+        form[f'rating_{i}'] = str((index + i) % 5 + 1)
+
+    barrier.wait()
+    start = time.perf_counter()
+    response = client.post(f'/rate/{self_name}', data=form)
+    elapsed = time.perf_counter() - start
+    if flush:
+        # Forked processes skip atexit hooks, so flush like a worker shutting down would
+        app_module.submission_writer.flush()
+    results.put((index, response.status_code, elapsed))
+
+
+def read_admin(stop, errors):
+    # One admin tab reloading while submissions come in; failures are collected in errors
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+    while not stop.is_set():
+        for path in READ_PATHS:
+            try:
+                response = client.get(path)
+                response.get_data()
+            except Exception as e:
+                errors.append(f'{path}: {e!r}')
+                continue
+            if response.status_code != 200:
+                errors.append(f'{path}: HTTP {response.status_code}')
+
+
+def run_processes(args):
+    ctx = multiprocessing.get_context('fork' if hasattr(os, 'fork') else 'spawn')
+    barrier = ctx.Barrier(args.submitters)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=submit, args=(i, barrier, results)) for i in range(args.submitters)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return outcomes, []
+
+
+def run_threads(args):
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    stop = threading.Event()
+    errors = []
+    readers = [threading.Thread(target=read_admin, args=(stop, errors)) for _ in range(args.readers)]
+    for reader in readers:
+        reader.start()
+    barrier = threading.Barrier(args.submitters)
+    results = queue.Queue()
+    submitters = [threading.Thread(target=submit, args=(i, barrier, results, False)) for i in range(args.submitters)]
+    for submitter in submitters:
+        submitter.start()
+    outcomes = [results.get() for _ in submitters]
+    app_module.submission_writer.flush()
+    stop.set()
+    for thread in submitters + readers:
+        thread.join()
+    return outcomes, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--submitters', type=int, default=200)
+    parser.add_argument('--participants', type=int, default=50)
+    parser.add_argument('--compact-every', type=int, default=25,
+                        help='Low by default so compactions race with appends')
+    parser.add_argument('--durability', choices=['sync', 'group', 'async'], default='sync',
+                        help='SUBMIT_DURABILITY used by the submitting processes')
+    parser.add_argument('--threads', action='store_true', help='Submit from threads of one process')
+    parser.add_argument('--readers', type=int, default=4, help='Admin reader threads with --threads')
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='fc25-load-')
+    write_participants(data_dir, args.participants)
+    os.environ['DATA_DIR'] = data_dir
+    os.environ['JOURNAL_COMPACT_EVERY'] = str(args.compact_every)
+    os.environ['SUBMIT_DURABILITY'] = args.durability
+
+    outcomes, read_errors = run_threads(args) if args.threads else run_processes(args)
+
+    sys.path.insert(0, ROOT)
+    from storage import RatingStore
+    store = RatingStore(data_dir)
+    store.compact()
+
+    failed = [index for index, status, _ in outcomes if status != 302]
+    missing_self = [i for i in range(args.submitters) if store.get_participant(f'submitter {i}') is None]
+    expected_ratings = args.submitters * 5
+    latencies = sorted(elapsed for _, _, elapsed in outcomes)
+
+    print(f'data dir:            {data_dir}')
+    print(f'submissions:         {len(outcomes)} ({len(failed)} failed)')
+    print(f'self-ratings stored: {args.submitters - len(missing_self)}/{args.submitters}')
+    print(f'ratings stored:      {len(store.ratings)}/{expected_ratings}')
+    print(f'latency p50/p99:     {latencies[len(latencies) // 2] * 1000:.1f} ms / '
+          f'{latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms')
+    if args.threads:
+        print(f'failed admin reads:  {len(read_errors)}')
+        for error in sorted(set(read_errors)):
+            print(f'  {error}')
+
+    if failed or missing_self or len(store.ratings) != expected_ratings:
+        print('LOST UPDATES DETECTED')
+        sys.exit(1)
+    if read_errors:
+        print('FAILED READS DETECTED')
+        sys.exit(1)
+    print('OK: no lost updates')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import threading
+from collections import OrderedDict
+
+
+class VersionedCache:
+    """
+    Memoizes values derived from the stored data, keyed on the store's data version.
+
+    Every write changes the data version, so the first lookup after a write (made in this
+    worker or picked up from another one) drops everything cached for the old version.
+    Values are computed outside the lock; two threads missing at once both compute and
+    the later one wins, which is harmless since they compute the same thing.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key, compute):
+        """
+        :param version: Current data version, e.g. from store.data_version()
+        :param key: Hashable key of the value within this version
+        :param compute: Called without arguments to build the value on a miss
+        """
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._entries.clear()
+            elif key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = value
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)  # Least recently used
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._entries.clear()
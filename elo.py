@@ -0,0 +1,53 @@
+import math
+
+# Rating every player starts from
+BASE_RATING = 1500.0
+# Points at stake per match, before the goal-difference multiplier
+K_FACTOR = 32.0
+
+
+def _margin_multiplier(goal_difference):
+    # Bigger wins move ratings more, with diminishing returns (as in the World Football Elo)
+    return math.log(abs(goal_difference) + 1) + 1 if goal_difference else 1.0
+
+
+class EloRatings:
+    """
+    Per-player Elo ratings from team match results.
+
+    A team plays at the average rating of its members and every member gains or loses
+    the team's rating change, so recording a result is O(players in the match).
+    """
+
+    def __init__(self):
+        self.ratings = {}  # key -> rating
+        self.games = {}  # key -> matches played
+
+    def rating(self, key):
+        return self.ratings.get(key, BASE_RATING)
+
+    def record(self, home, away, home_goals, away_goals):
+        """
+        Updates the ratings of everyone in one match.
+
+        :param home: Keys of the home team's players
+        :param away: Keys of the away team's players
+        """
+        if not home or not away:
+            return
+        home_rating = sum(self.rating(key) for key in home) / len(home)
+        away_rating = sum(self.rating(key) for key in away) / len(away)
+        expected = 1 / (1 + 10 ** ((away_rating - home_rating) / 400))
+        actual = 1.0 if home_goals > away_goals else 0.5 if home_goals == away_goals else 0.0
+        change = K_FACTOR * _margin_multiplier(home_goals - away_goals) * (actual - expected)
+        for keys, delta in ((home, change), (away, -change)):
+            for key in keys:
+                self.ratings[key] = self.rating(key) + delta
+                self.games[key] = self.games.get(key, 0) + 1
+
+    def rebuild(self, matches):
+        """Recomputes everything from (home keys, away keys, home goals, away goals) in order."""
+        self.ratings = {}
+        self.games = {}
+        for home, away, home_goals, away_goals in matches:
+            self.record(home, away, home_goals, away_goals)
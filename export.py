@@ -0,0 +1,142 @@
+import csv
+import itertools
+import json
+
+from storage import MEMBER_SEPARATOR, normalize_name, parse_rating
+
+# Output formats of the admin export endpoint and their content types
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# Columns of each export, stored ones first and computed ones after
+EXPORT_COLUMNS = {
+    'players': ['name', 'self_rating', 'average', 'median', 'count', 'adjusted', 'rater_bias',
+                'elo', 'matches', 'strength', 'team', 'team_avg'],
+    'ratings': ['rater', 'rated_player', 'rating', 'rated_average', 'rated_median', 'deviation'],
+    'matches': ['match_id', 'home', 'away', 'home_goals', 'away_goals'],
+}
+
+# Rows joined into one chunk before it is handed to the server, so a large export is
+# written in a few hundred writes instead of one per row
+CHUNK_ROWS = 500
+
+
+def _value(value):
+    # Missing scores are 'N/A' on the admin page, but empty (CSV) or null (JSON) in exports
+    return None if value == 'N/A' else value
+
+
+def _score(value):
+    # Fitted and blended scores rounded like the averages
+    return round(value, 2) if isinstance(value, float) else _value(value)
+
+
+def player_rows(statistics, participants, teams=()):
+    """
+    Yields one export row per player.
+
+    :param statistics: Ranked player statistics, as on the admin page
+    :param participants: Mapping of normalized name to participant row, for the self-ratings
+    :param teams: Teams as from assign_teams; adds each player's team number and team average
+    """
+    team_of = {normalize_name(member): (number, team['combined_avg'])
+               for number, team in enumerate(teams, start=1) for member in team['members']}
+    for player_stat in statistics:
+        key = normalize_name(player_stat['name'])
+        participant = participants.get(key)
+        team, team_avg = team_of.get(key, (None, None))
+        yield {
+            'name': player_stat['name'],
+            'self_rating': parse_rating(participant['rating']) if participant else None,
+            'average': _value(player_stat['average']),
+            'median': _value(player_stat['median']),
+            'count': player_stat['count'],
+            'adjusted': _score(player_stat.get('adjusted')),
+            'rater_bias': _score(player_stat.get('rater_bias')),
+            'elo': round(player_stat['elo'], 1),
+            'matches': player_stat['matches'],
+            'strength': _score(player_stat['strength']),
+            'team': team,
+            'team_avg': _value(team_avg),
+        }
+
+
+def rating_rows(ratings, statistics):
+    """
+    Yields one export row per rating, with the rated player's average and median and how
+    far this rating is from that average.
+
+    :param ratings: Rating records from the store
+    :param statistics: Mapping of normalized name to player statistics
+    """
+    # Rating records share one string per spelling of a name, so each is normalized once
+    by_spelling = {}
+    for row in ratings:
+        rating = row.score
+        player_stat = by_spelling.get(row.rated_player)
+        if player_stat is None:
+            player_stat = by_spelling[row.rated_player] = statistics.get(normalize_name(row.rated_player), {})
+        average = _value(player_stat.get('average'))
+        yield {
+            'rater': row.rater,
+            'rated_player': row.rated_player,
+            'rating': rating,
+            'rated_average': average,
+            'rated_median': _value(player_stat.get('median')),
+            'deviation': round(rating - average, 2) if rating is not None and average is not None else None,
+        }
+
+
+def match_rows(matches, player=''):
+    """
+    Yields the stored match results.
+
+    :param player: Only matches this player took part in (case-insensitive)
+    """
+    key = normalize_name(player)
+    for row in matches:
+        if key:
+            members = row['home'].split(MEMBER_SEPARATOR) + row['away'].split(MEMBER_SEPARATOR)
+            if key not in {normalize_name(member) for member in members}:
+                continue
+        yield {
+            'match_id': row['match_id'],
+            'home': row['home'],
+            'away': row['away'],
+            'home_goals': int(row['home_goals']),
+            'away_goals': int(row['away_goals']),
+        }
+
+
+class _Echo:
+    # File-like object for csv.writer that hands each formatted line back instead of storing it
+    def write(self, line):
+        return line
+
+
+def _csv_lines(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(['' if row[column] is None else row[column] for column in columns])
+
+
+def _jsonl_lines(columns, rows):
+    for row in rows:
+        yield json.dumps({column: row[column] for column in columns}, ensure_ascii=False) + '\n'
+
+
+def stream(rows, columns, fmt):
+    """
+    Serializes rows lazily, so only one chunk of the output is ever held in memory.
+
+    :param rows: Iterable of export rows
+    :param columns: Columns to write, in order
+    :param fmt: 'csv' or 'jsonl'
+    :return: Iterator of text chunks
+    """
+    lines = _csv_lines(columns, rows) if fmt == 'csv' else _jsonl_lines(columns, rows)
+    while True:
+        chunk = ''.join(itertools.islice(lines, CHUNK_ROWS))
+        if not chunk:
+            return
+        yield chunk
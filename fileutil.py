@@ -0,0 +1,63 @@
+import os
+from contextlib import contextmanager
+
+from metrics import record_io
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; fall back to in-process locking only
+    fcntl = None
+
+
+def file_stamp(path):
+    """
+    Cheap change detection: a write by any process changes at least one of these.
+
+    :return: Tuple of (inode, mtime in ns, size), or None if the file does not exist
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def atomic_write(path, data):
+    """
+    Writes to a temporary file and renames it over the target, so readers and crashes
+    only ever see the old or the new content, never a truncated file.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        record_io(file_opens=1, bytes_written=len(data))
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_bytes(path):
+    """:return: The file's content, or None if it does not exist"""
+    try:
+        with open(path, 'rb') as f:
+            record_io(file_opens=1)
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def flock(lock_file, exclusive=True):
+    """
+    Holds flock() on an open file, shared or exclusive, to serialize access across
+    gunicorn workers. Does nothing where flock() is not available; callers still need
+    their own lock between threads.
+    """
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield
+    finally:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
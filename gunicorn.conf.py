@@ -0,0 +1,15 @@
+# Read by gunicorn when it is started from this directory (see Procfile)
+import os
+
+# Threaded workers: an open admin page keeps an event stream (/admin/events) running, which
+# holds one thread instead of a whole worker, and rate-form submissions in flight at the
+# same time can share one fsync (SUBMIT_DURABILITY=group). The store, caches and metrics
+# are safe to use from several threads. Each open admin page takes one of the threads.
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+def post_worker_init(worker):
+    # Runs in each new worker before it accepts requests, so the first visitors after a
+    # worker starts do not wait for the data to load or the templates to compile
+    from app import warm_up
+    warm_up()
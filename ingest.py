@@ -0,0 +1,144 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# How a rate-form submission is acknowledged:
+#   sync    written and fsynced in the request thread before the response (the default)
+#   group   handed to the background writer; the request waits until the batch holding
+#           it is fsynced, so many concurrent submissions share one fsync. Only submissions
+#           in flight in the same worker at once are batched, which needs a threaded worker
+#           class (e.g. gunicorn's gthread); a sync worker handles one request at a time,
+#           so there every batch holds one submission and group only adds up to max_delay
+#           of latency
+#   async   acknowledged as soon as it is queued; written within max_delay seconds, and
+#           flushed when the worker shuts down cleanly
+DURABILITY_LEVELS = ('sync', 'group', 'async')
+
+
+class _Submission:
+    __slots__ = ('entry', 'done', 'error')
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.done = threading.Event()
+        self.error = None
+
+
+class SubmissionWriter:
+    """
+    Queues rate-form submissions and writes them to the store in batches from one
+    background thread, each batch as a single journal line with a single fsync.
+    """
+
+    def __init__(self, store, durability='sync', max_batch=200, max_delay=0.05):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f'Unknown durability level: {durability}')
+        self.store = store
+        self.durability = durability
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+        self.batches = 0
+        self.submissions = 0
+
+    def submit(self, rater, self_rating, ratings):
+        """
+        Stores one submission according to the durability level.
+
+        :param ratings: List of (rated_player, rating) tuples with already validated ratings
+        """
+        entry = (rater, self_rating, ratings)
+        if self.durability == 'sync' or self._stopping:
+            self.store.submit_ratings([entry])
+            return
+        self._ensure_started()
+        submission = _Submission(entry)
+        self._queue.put(submission)
+        if self.durability == 'group':
+            submission.done.wait()
+            if submission.error is not None:
+                raise submission.error
+
+    def _ensure_started(self):
+        # Started lazily, so every gunicorn worker gets its own thread after forking
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='submission-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0] is None:
+                return
+            deadline = time.monotonic() + self.max_delay
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        # A failed write may still have reached the journal, so retries reuse the batch id
+        batch_id = uuid.uuid4().hex
+        while True:
+            try:
+                self.store.submit_ratings([submission.entry for submission in batch], batch_id=batch_id)
+            except Exception as e:
+                if self.durability == 'group':
+                    # The waiting requests report the failure themselves
+                    for submission in batch:
+                        submission.error = e
+                        submission.done.set()
+                    return
+                # Nobody is waiting for async submissions; keep them and try again
+                logger.exception('Writing %d submissions failed; retrying', len(batch))
+                time.sleep(1)
+                continue
+            self.batches += 1
+            self.submissions += len(batch)
+            for submission in batch:
+                submission.done.set()
+            return
+
+    def flush(self, timeout=None):
+        """Writes everything queued so far and stops the background thread."""
+        self._stopping = True
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+        # Submissions queued while the thread was stopping are written here
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                leftover.append(item)
+        if leftover:
+            self._write(leftover)
+
+    def register_shutdown(self):
+        # Flush when the interpreter exits normally, e.g. a gunicorn worker shutting down
+        atexit.register(self.flush)
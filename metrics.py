@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from collections import deque
+
+# I/O counters of the request being handled on this thread
+_current = threading.local()
+
+IO_COUNTERS = ('file_opens', 'rows_parsed', 'bytes_written')
+
+
+def record_io(file_opens=0, rows_parsed=0, bytes_written=0):
+    """Adds storage I/O to the current request's counters; a no-op outside a request."""
+    counters = getattr(_current, 'counters', None)
+    if counters is not None:
+        counters['file_opens'] += file_opens
+        counters['rows_parsed'] += rows_parsed
+        counters['bytes_written'] += bytes_written
+
+
+class RouteMetrics:
+    __slots__ = ('count', 'total_seconds', 'max_seconds', 'file_opens', 'rows_parsed', 'bytes_written', 'recent')
+
+    def __init__(self, recent_size):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.file_opens = 0
+        self.rows_parsed = 0
+        self.bytes_written = 0
+        self.recent = deque(maxlen=recent_size)  # Latest durations, for percentiles
+
+
+class Metrics:
+    """
+    Per-route wall time and storage I/O, aggregated in this worker process.
+
+    The app calls start() when a request begins and finish() once its response has been
+    fully sent, so streamed pages are timed until their last byte.
+    """
+
+    def __init__(self, recent_size=500):
+        self.recent_size = recent_size
+        self.started_at = time.time()
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Starts timing a request on this thread.
+
+        :return: Token to pass to finish()
+        """
+        _current.counters = dict.fromkeys(IO_COUNTERS, 0)
+        return time.perf_counter(), _current.counters
+
+    def finish(self, route, token):
+        started, counters = token
+        elapsed = time.perf_counter() - started
+        if getattr(_current, 'counters', None) is counters:
+            _current.counters = None
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteMetrics(self.recent_size)
+            stats.count += 1
+            stats.total_seconds += elapsed
+            stats.max_seconds = max(stats.max_seconds, elapsed)
+            stats.recent.append(elapsed)
+            for name in IO_COUNTERS:
+                setattr(stats, name, getattr(stats, name) + counters[name])
+
+    def snapshot(self):
+        """
+        :return: List of dictionaries, one per route, slowest total time first
+        """
+        rows = []
+        with self._lock:
+            for route, stats in self._routes.items():
+                recent = sorted(stats.recent)
+                rows.append({
+                    'route': route,
+                    'count': stats.count,
+                    'total_ms': round(stats.total_seconds * 1000, 1),
+                    'mean_ms': round(stats.total_seconds / stats.count * 1000, 2),
+                    'p50_ms': round(recent[len(recent) // 2] * 1000, 2),
+                    'p95_ms': round(recent[min(int(len(recent) * 0.95), len(recent) - 1)] * 1000, 2),
+                    'max_ms': round(stats.max_seconds * 1000, 2),
+                    'file_opens': stats.file_opens,
+                    'rows_parsed': stats.rows_parsed,
+                    'bytes_written': stats.bytes_written,
+                })
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)
+
+    def prometheus(self):
+        """Metrics in the Prometheus text exposition format."""
+        series = (
+            ('fc25_requests_total', 'counter', 'Requests handled by this worker.', 'count', 1),
+            ('fc25_request_seconds_sum', 'counter', 'Wall time spent in requests.', 'total_ms', 0.001),
+            ('fc25_request_seconds_max', 'gauge', 'Slowest request.', 'max_ms', 0.001),
+            ('fc25_file_opens_total', 'counter', 'Data files opened.', 'file_opens', 1),
+            ('fc25_rows_parsed_total', 'counter', 'CSV rows and journal lines parsed.', 'rows_parsed', 1),
+            ('fc25_bytes_written_total', 'counter', 'Bytes written to data files.', 'bytes_written', 1),
+        )
+        rows = self.snapshot()
+        pid = os.getpid()
+        lines = []
+        for name, kind, help_text, key, scale in series:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for row in rows:
+                route = row['route'].replace('\\', '\\\\').replace('"', '\\"')
+                lines.append(f'{name}{{route="{route}",pid="{pid}"}} {row[key] * scale:g}')
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by the app and the storage layer
+metrics = Metrics()
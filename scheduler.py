@@ -0,0 +1,435 @@
+import json
+import string
+import threading
+import uuid
+from contextlib import contextmanager
+
+from fileutil import atomic_write, file_stamp, flock, read_bytes
+
+# Available tournament formats, selectable by name
+FORMATS = ('round_robin', 'groups')
+# Later rounds considered when filling a console slot; keeps teams' match counts even
+# and bounds the work per slot, so packing stays linear in the number of fixtures
+LOOKAHEAD_ROUNDS = 1
+
+KNOCKOUT_STAGES = {2: 'Final', 4: 'Semi-final', 8: 'Quarter-final'}
+
+
+def round_robin_rounds(team_ids):
+    """
+    Circle method: every team meets every other team once, playing at most once per round.
+
+    :return: List of rounds, each a list of (home, away) pairs
+    """
+    ids = list(team_ids)
+    if len(ids) % 2:
+        ids.append(None)  # Bye
+    rounds = []
+    for number in range(len(ids) - 1):
+        pairs = []
+        for i in range(len(ids) // 2):
+            home, away = ids[i], ids[-1 - i]
+            if home is not None and away is not None:
+                pairs.append((home, away) if number % 2 == 0 else (away, home))
+        rounds.append(pairs)
+        ids = [ids[0], ids[-1]] + ids[1:-1]  # Rotate everyone but the first
+    return rounds
+
+
+def _bracket_order(size):
+    # Seed numbers in bracket order, so the top seeds can only meet in the last rounds
+    order = [0]
+    while len(order) < size:
+        order = [seed for s in order for seed in (s, len(order) * 2 - 1 - s)]
+    return order
+
+
+def _team_strength(team):
+    return team['combined_avg'] if isinstance(team['combined_avg'], float) else 0.0
+
+
+def create_schedule(teams, fmt='round_robin', consoles=2, group_size=4, advance=2):
+    """
+    Builds the fixtures for a tournament between the given teams and packs them onto consoles.
+
+    :param teams: Teams as returned by assign_teams()
+    :param fmt: 'round_robin' (everyone plays everyone) or 'groups' (round robin groups
+                whose top `advance` teams go through to a knockout bracket)
+    :param consoles: Matches that can be played at the same time
+    :return: Schedule dictionary, to be stored as JSON
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown tournament format: {fmt}')
+    if len(teams) < 2:
+        raise ValueError('At least two teams are needed for a tournament')
+    if consoles < 1:
+        raise ValueError('At least one console is needed')
+
+    schedule = {
+        'id': uuid.uuid4().hex[:12],  # Tells match results of different tournaments apart
+        'format': fmt,
+        'consoles': consoles,
+        'teams': [{'name': f'Team {i + 1}', 'members': team['members'], 'combined_avg': team['combined_avg']}
+                  for i, team in enumerate(teams)],
+        'groups': {},
+        'fixtures': [],
+    }
+    fixtures = schedule['fixtures']
+
+    def add_fixture(stage, round_number, home, away):
+        fixtures.append({'id': len(fixtures) + 1, 'stage': stage, 'round': round_number,
+                         'home': home, 'away': away, 'slot': None, 'console': None, 'score': None})
+        return fixtures[-1]['id']
+
+    if fmt == 'round_robin':
+        for number, pairs in enumerate(round_robin_rounds(range(len(teams))), start=1):
+            for home, away in pairs:
+                add_fixture('Round robin', number, {'team': home}, {'team': away})
+    else:
+        group_size = max(group_size, 2)
+        group_count = max(1, -(-len(teams) // group_size))
+        if group_count > len(string.ascii_uppercase):
+            raise ValueError('Too many groups; use a larger group size')
+        # Snake the teams over the groups by strength, so every group gets a fair mix
+        ranked = sorted(range(len(teams)), key=lambda i: _team_strength(teams[i]), reverse=True)
+        groups = [[] for _ in range(group_count)]
+        for position, team_id in enumerate(ranked):
+            round_number, index = divmod(position, group_count)
+            groups[index if round_number % 2 == 0 else group_count - 1 - index].append(team_id)
+
+        group_rounds = 0
+        for name, members in zip(string.ascii_uppercase, groups):
+            schedule['groups'][name] = sorted(members)
+            for number, pairs in enumerate(round_robin_rounds(sorted(members)), start=1):
+                group_rounds = max(group_rounds, number)
+                for home, away in pairs:
+                    add_fixture(f'Group {name}', number, {'team': home}, {'team': away})
+
+        # Group winners are seeded first, then the runners-up, and so on; seeds beyond the
+        # number of qualifiers are byes that send their opponent straight to the next round
+        advance = max(1, min(advance, min(len(members) for members in groups)))
+        seeds = [{'group': name, 'place': place}
+                 for place in range(1, advance + 1) for name in sorted(schedule['groups'])]
+        if len(seeds) > 1:
+            size = 1
+            while size < len(seeds):
+                size *= 2
+            entries = [seeds[seed] if seed < len(seeds) else None for seed in _bracket_order(size)]
+            round_number = group_rounds
+            while len(entries) > 1:
+                round_number += 1
+                stage = KNOCKOUT_STAGES.get(len(entries), f'Round of {len(entries)}')
+                next_entries = []
+                for home, away in zip(entries[::2], entries[1::2]):
+                    if home is None or away is None:
+                        next_entries.append(home or away)
+                    else:
+                        next_entries.append({'winner': add_fixture(stage, round_number, home, away)})
+                entries = next_entries
+
+    pack(schedule)
+    return schedule
+
+
+class _Resolver:
+    """Works out who plays in each fixture from the results entered so far."""
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.fixtures = {fixture['id']: fixture for fixture in schedule['fixtures']}
+        self.group_fixtures = {}
+        for fixture in schedule['fixtures']:
+            if fixture['stage'].startswith('Group '):
+                self.group_fixtures.setdefault(fixture['stage'][len('Group '):], []).append(fixture['id'])
+        self._standings = {}
+        self._possible = {}
+
+    def standings(self, group=None):
+        """Group (or whole round robin) table, best team first."""
+        if group not in self._standings:
+            if group is None:
+                team_ids = range(len(self.schedule['teams']))
+                fixtures = [f for f in self.schedule['fixtures'] if f['stage'] == 'Round robin']
+            else:
+                team_ids = self.schedule['groups'][group]
+                fixtures = [self.fixtures[i] for i in self.group_fixtures.get(group, ())]
+            self._standings[group] = standings(team_ids, fixtures)
+        return self._standings[group]
+
+    def group_complete(self, group):
+        return all(self.fixtures[i]['score'] is not None for i in self.group_fixtures.get(group, ()))
+
+    def team(self, source):
+        """Team id behind a fixture side, or None while it depends on unplayed matches."""
+        if 'team' in source:
+            return source['team']
+        if 'group' in source:
+            if not self.group_complete(source['group']):
+                return None
+            return self.standings(source['group'])[source['place'] - 1]['team']
+        return self.winner(self.fixtures[source['winner']])
+
+    def winner(self, fixture):
+        if fixture['score'] is None:
+            return None
+        home_goals, away_goals = fixture['score']
+        if home_goals == away_goals:
+            return None
+        return self.team(fixture['home'] if home_goals > away_goals else fixture['away'])
+
+    def possible_teams(self, source):
+        """Every team that could still end up on this side, for keeping their slots apart."""
+        key = json.dumps(source, sort_keys=True)
+        if key not in self._possible:
+            team = self.team(source)
+            if team is not None:
+                possible = frozenset([team])
+            elif 'group' in source:
+                possible = frozenset(self.schedule['groups'][source['group']])
+            else:
+                fixture = self.fixtures[source['winner']]
+                possible = self.possible_teams(fixture['home']) | self.possible_teams(fixture['away'])
+            self._possible[key] = possible
+        return self._possible[key]
+
+    def dependencies(self, fixture):
+        """Fixtures that have to be played before this one."""
+        depends = []
+        for source in (fixture['home'], fixture['away']):
+            if 'group' in source:
+                depends.extend(self.group_fixtures.get(source['group'], ()))
+            elif 'winner' in source:
+                depends.append(source['winner'])
+        return depends
+
+
+def standings(team_ids, fixtures):
+    """
+    League table from the scored fixtures: 3 points for a win, 1 for a draw, then goal
+    difference and goals scored.
+
+    :return: List of dictionaries with 'team', 'played', 'won', 'drawn', 'lost',
+             'goals_for', 'goals_against' and 'points' keys, best team first
+    """
+    table = {team: {'team': team, 'played': 0, 'won': 0, 'drawn': 0, 'lost': 0,
+                    'goals_for': 0, 'goals_against': 0, 'points': 0} for team in team_ids}
+    for fixture in fixtures:
+        if fixture['score'] is None:
+            continue
+        home, away = table[fixture['home']['team']], table[fixture['away']['team']]
+        for row, scored, conceded in ((home, fixture['score'][0], fixture['score'][1]),
+                                      (away, fixture['score'][1], fixture['score'][0])):
+            row['played'] += 1
+            row['goals_for'] += scored
+            row['goals_against'] += conceded
+            if scored > conceded:
+                row['won'] += 1
+                row['points'] += 3
+            elif scored == conceded:
+                row['drawn'] += 1
+                row['points'] += 1
+            else:
+                row['lost'] += 1
+    return sorted(table.values(), key=lambda row: (-row['points'], row['goals_against'] - row['goals_for'],
+                                                   -row['goals_for'], row['team']))
+
+
+def pack(schedule, start_slot=0):
+    """
+    Assigns a time slot and console to every fixture not played before start_slot.
+
+    Slots are filled one at a time with the earliest-round fixtures whose teams are free
+    and whose prerequisite matches are in earlier slots. Teams that just played are only
+    picked when no rested team can fill a console, so idle consoles are avoided first and
+    back-to-back matches second. Fixtures already scored or in earlier slots keep their place.
+    """
+    resolver = _Resolver(schedule)
+    consoles = schedule['consoles']
+    placed_slot = {}
+    last_played = {}  # team id -> latest slot it plays in
+    pending = []
+    for fixture in schedule['fixtures']:
+        if fixture['score'] is not None or (fixture['slot'] is not None and fixture['slot'] < start_slot):
+            placed_slot[fixture['id']] = fixture['slot'] if fixture['slot'] is not None else start_slot - 1
+            for source in (fixture['home'], fixture['away']):
+                for team in resolver.possible_teams(source):
+                    last_played[team] = max(last_played.get(team, -1), placed_slot[fixture['id']])
+        else:
+            fixture['slot'] = fixture['console'] = None
+            pending.append(fixture)
+    pending.sort(key=lambda f: (f['round'], f['id']))
+    teams_of = {f['id']: resolver.possible_teams(f['home']) | resolver.possible_teams(f['away']) for f in pending}
+    depends_on = {f['id']: resolver.dependencies(f) for f in pending}
+
+    slot = start_slot
+    head = 0
+    while head < len(pending):
+        busy = set()
+        chosen = []
+        for allow_back_to_back in (False, True):
+            first_round = pending[head]['round']
+            for fixture in pending[head:]:
+                if len(chosen) == consoles or fixture['round'] > first_round + LOOKAHEAD_ROUNDS:
+                    break
+                if fixture['slot'] is not None:
+                    continue
+                teams = teams_of[fixture['id']]
+                if teams & busy:
+                    continue
+                if not allow_back_to_back and any(last_played.get(team, -2) == slot - 1 for team in teams):
+                    continue
+                if any(placed_slot.get(dependency, slot) >= slot for dependency in depends_on[fixture['id']]):
+                    continue
+                fixture['slot'] = slot
+                fixture['console'] = len(chosen) + 1
+                chosen.append(fixture)
+                busy |= teams
+        for fixture in chosen:
+            placed_slot[fixture['id']] = slot
+            for team in teams_of[fixture['id']]:
+                last_played[team] = slot
+        while head < len(pending) and pending[head]['slot'] is not None:
+            head += 1
+        slot += 1
+    return schedule
+
+
+def record_result(schedule, fixture_id, home_goals, away_goals):
+    """
+    Stores a match result and reschedules the fixtures after the latest slot with a result,
+    now that later knockout matches may know their teams.
+
+    :return: The schedule
+    """
+    fixture = next((f for f in schedule['fixtures'] if f['id'] == fixture_id), None)
+    if fixture is None:
+        raise ValueError(f'No fixture {fixture_id}')
+    if home_goals < 0 or away_goals < 0:
+        raise ValueError('Goals cannot be negative')
+    resolver = _Resolver(schedule)
+    if resolver.team(fixture['home']) is None or resolver.team(fixture['away']) is None:
+        raise ValueError('This match does not have both teams yet')
+    if not fixture['stage'].startswith(('Group ', 'Round robin')) and home_goals == away_goals:
+        raise ValueError('Knockout matches need a winner')
+    fixture['score'] = [home_goals, away_goals]
+    played = [f['slot'] for f in schedule['fixtures'] if f['score'] is not None and f['slot'] is not None]
+    return pack(schedule, start_slot=max(played) + 1)
+
+
+def fixture_members(schedule, fixture_id):
+    """
+    :return: Tuple of (home player names, away player names) of a fixture with both teams known
+    """
+    resolver = _Resolver(schedule)
+    fixture = resolver.fixtures[fixture_id]
+    home, away = resolver.team(fixture['home']), resolver.team(fixture['away'])
+    if home is None or away is None:
+        raise ValueError('This match does not have both teams yet')
+    return schedule['teams'][home]['members'], schedule['teams'][away]['members']
+
+
+def summary(schedule):
+    """
+    Schedule as shown to the admin: fixtures per slot with team names filled in, plus
+    standings and how well the consoles are used.
+    """
+    resolver = _Resolver(schedule)
+    teams = schedule['teams']
+
+    def describe(source):
+        team = resolver.team(source)
+        if team is not None:
+            return teams[team]['name']
+        if 'group' in source:
+            return f"Group {source['group']} #{source['place']}"
+        return f"Winner of match {source['winner']}"
+
+    slots = {}
+    back_to_back = 0
+    last_slot = {}
+    for fixture in sorted(schedule['fixtures'], key=lambda f: (f['slot'], f['console'])):
+        home, away = resolver.team(fixture['home']), resolver.team(fixture['away'])
+        for team in (home, away):
+            if team is not None:
+                back_to_back += last_slot.get(team) == fixture['slot'] - 1
+                last_slot[team] = fixture['slot']
+        slots.setdefault(fixture['slot'], []).append(dict(
+            fixture, home_name=describe(fixture['home']), away_name=describe(fixture['away']),
+            ready=home is not None and away is not None))
+
+    slot_count = max(slots) + 1 if slots else 0
+    tables = {}
+    if schedule['format'] == 'round_robin':
+        tables['Round robin'] = resolver.standings()
+    for group in schedule['groups']:
+        tables[f'Group {group}'] = resolver.standings(group)
+    final = next((f for f in schedule['fixtures'] if f['stage'] == 'Final'), None)
+    champion = None
+    if final is not None and resolver.winner(final) is not None:
+        champion = teams[resolver.winner(final)]['name']
+    elif schedule['format'] == 'round_robin' and all(f['score'] is not None for f in schedule['fixtures']):
+        champion = teams[tables['Round robin'][0]['team']]['name']
+
+    return {
+        'slots': [(slot, slots[slot]) for slot in sorted(slots)],
+        'standings': {stage: [dict(row, name=teams[row['team']]['name']) for row in rows]
+                      for stage, rows in tables.items()},
+        'slot_count': slot_count,
+        'idle_consoles': slot_count * schedule['consoles'] - len(schedule['fixtures']),
+        'back_to_back': back_to_back,
+        'champion': champion,
+    }
+
+
+class ScheduleFile:
+    """
+    The current tournament schedule, kept in schedule.json so every worker sees it.
+
+    Changes are read-modify-write under an exclusive flock on a lock file next to it, and
+    the file is replaced atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._schedule = None
+
+    def load(self):
+        """:return: The schedule dictionary, or None if none has been generated"""
+        with self._lock:
+            stamp = file_stamp(self.path)
+            if stamp != self._stamp:
+                data = read_bytes(self.path)
+                self._schedule = json.loads(data) if data else None
+                self._stamp = stamp
+            return self._schedule
+
+    @contextmanager
+    def _exclusive(self):
+        with self._lock, open(self.lock_path, 'a+b') as lock_file, flock(lock_file):
+            yield
+
+    def save(self, schedule):
+        with self._exclusive():
+            self._write(schedule)
+
+    def update(self, change):
+        """
+        Applies change(schedule) to the latest saved schedule and saves the result.
+
+        :return: The updated schedule
+        """
+        with self._exclusive():
+            schedule = self.load()
+            if schedule is None:
+                raise ValueError('No schedule has been generated yet')
+            schedule = change(json.loads(json.dumps(schedule)))  # Never mutate the cached copy
+            self._write(schedule)
+            return schedule
+
+    def _write(self, schedule):
+        atomic_write(self.path, json.dumps(schedule, ensure_ascii=False).encode('utf-8'))
+        self._schedule = schedule
+        self._stamp = file_stamp(self.path)
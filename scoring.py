@@ -0,0 +1,114 @@
+import elo
+
+# Pseudo-ratings of "no offset" added to every rater and player; pulls raters and players
+# with only a handful of ratings towards the overall mean instead of trusting them fully
+SHRINKAGE = 2.0
+# Stop once no offset moves by more than this between two sweeps
+TOLERANCE = 1e-4
+MAX_ITERATIONS = 100
+
+
+def fit_offsets(rater_index, player_index, scores, rater_count, player_count,
+                shrinkage=SHRINKAGE, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+    """
+    Fits score = mean + rater bias + player offset by regularized alternating least squares.
+
+    The ratings are the non-empty cells of the rater x player matrix, given as three
+    parallel sequences. Every sweep updates all player offsets from the residuals left by
+    the rater biases and then all rater biases from the residuals left by the player
+    offsets, each a plain Python loop over the ratings.
+
+    :param rater_index: Row (rater) number of each rating
+    :param player_index: Column (player) number of each rating
+    :param scores: The ratings themselves
+    :return: Tuple of (mean, rater biases, player offsets)
+    """
+    if not scores:
+        return 0.0, [0.0] * rater_count, [0.0] * player_count
+    mean = sum(scores) / len(scores)
+    residuals = [score - mean for score in scores]
+
+    rater_n = [0] * rater_count
+    player_n = [0] * player_count
+    for r in rater_index:
+        rater_n[r] += 1
+    for p in player_index:
+        player_n[p] += 1
+    rater_weight = [1.0 / (n + shrinkage) for n in rater_n]
+    player_weight = [1.0 / (n + shrinkage) for n in player_n]
+
+    bias = [0.0] * rater_count
+    offset = [0.0] * player_count
+    edges = list(zip(rater_index, player_index, residuals))
+    for _ in range(max_iterations):
+        sums = [0.0] * player_count
+        for r, p, residual in edges:
+            sums[p] += residual - bias[r]
+        new_offset = [s * w for s, w in zip(sums, player_weight)]
+
+        sums = [0.0] * rater_count
+        for r, p, residual in edges:
+            sums[r] += residual - new_offset[p]
+        new_bias = [s * w for s, w in zip(sums, rater_weight)]
+
+        change = max(max(map(abs, map(float.__sub__, new_offset, offset)), default=0.0),
+                     max(map(abs, map(float.__sub__, new_bias, bias)), default=0.0))
+        offset, bias = new_offset, new_bias
+        if change < tolerance:
+            break
+    return mean, bias, offset
+
+
+def adjusted_scores(ratings):
+    """
+    Bias-corrected score per player: what an average rater would have given them.
+
+    :param ratings: Iterable of (rater key, player key, score) tuples; a self-rating is
+                    a rating the player gave themself
+    :return: Tuple of ({player key: adjusted score clamped to 1..5},
+             {rater key: how far above the average rater they score})
+    """
+    raters = {}
+    players = {}
+    rater_index = []
+    player_index = []
+    scores = []
+    for rater, player, score in ratings:
+        rater_index.append(raters.setdefault(rater, len(raters)))
+        player_index.append(players.setdefault(player, len(players)))
+        scores.append(score)
+
+    mean, bias, offset = fit_offsets(rater_index, player_index, scores, len(raters), len(players))
+    adjusted = {player: min(max(mean + offset[p], 1.0), 5.0) for player, p in players.items()}
+    biases = {rater: bias[r] for rater, r in raters.items()}
+    return adjusted, biases
+
+
+# Elo points worth one step on the 1..5 rating scale; the starting Elo maps to a 3
+ELO_POINTS_PER_STEP = 200.0
+# Matches after which the match-based rating gets its full weight in a blend
+FULL_WEIGHT_MATCHES = 10
+
+
+def elo_to_scale(rating):
+    """Elo rating translated to the 1..5 scale of the peer ratings."""
+    return min(max(3.0 + (rating - elo.BASE_RATING) / ELO_POINTS_PER_STEP, 1.0), 5.0)
+
+
+def blend(peer_score, elo_rating, matches, match_weight):
+    """
+    Mixes a peer score with a match-based Elo rating.
+
+    The Elo side gets match_weight (0..1) once a player has FULL_WEIGHT_MATCHES matches
+    and proportionally less before that, so players who have not played keep their
+    peer score exactly.
+
+    :param peer_score: Average or adjusted score, or 'N/A'
+    :return: Blended score on the 1..5 scale, or 'N/A' if there is neither
+    """
+    if not matches:
+        return peer_score
+    if not isinstance(peer_score, float):
+        return elo_to_scale(elo_rating)
+    weight = match_weight * min(matches / FULL_WEIGHT_MATCHES, 1.0)
+    return (1 - weight) * peer_score + weight * elo_to_scale(elo_rating)
@@ -0,0 +1,144 @@
+import bisect
+import random
+import time
+from collections import deque
+
+
+class LeastRatedPicker:
+    """
+    Bucketed "times rated" counter used to hand out the least-rated participants.
+
+    Participants are kept in buckets keyed by how often they have been rated plus how many
+    open reservations they have, and a sorted list of the non-empty bucket levels is kept
+    alongside. Picking k players walks the lowest levels only and breaks ties randomly,
+    drawing keys from a bucket by index, so a pick costs O(k + len(exclude)) plus the
+    level lookups no matter how many players share the lowest count.
+    Handed-out players are reserved for `reservation_ttl` seconds (or until the rater
+    submits), so raters loading the page at the same time get different players.
+    """
+
+    def __init__(self, reservation_ttl=600, rng=None):
+        self.reservation_ttl = reservation_ttl
+        self._rng = rng or random.Random()
+        self._counts = {}  # key -> effective count (ratings + open reservations)
+        self._buckets = {}  # effective count -> list of keys, in no particular order
+        self._positions = {}  # key -> index in its bucket
+        self._levels = []  # Sorted effective counts that have a non-empty bucket
+        self._reservations = {}  # rater key -> (expires_at, [keys])
+        self._expiry_queue = deque()  # (expires_at, rater key), in expiry order
+
+    # --- Bucket bookkeeping ---
+
+    def _place(self, key, count):
+        self._counts[key] = count
+        bucket = self._buckets.get(count)
+        if bucket is None:
+            bucket = self._buckets[count] = []
+            bisect.insort(self._levels, count)
+        self._positions[key] = len(bucket)
+        bucket.append(key)
+
+    def _unplace(self, key):
+        count = self._counts.pop(key)
+        bucket = self._buckets[count]
+        # Removed in O(1) by moving the bucket's last key into the freed slot
+        index = self._positions.pop(key)
+        last = bucket.pop()
+        if index < len(bucket):
+            bucket[index] = last
+            self._positions[last] = index
+        if not bucket:
+            del self._buckets[count]
+            del self._levels[bisect.bisect_left(self._levels, count)]
+        return count
+
+    def rebuild(self, counts):
+        """Resets the counter from {key: times rated}, keeping open reservations."""
+        self._counts = {}
+        self._buckets = {}
+        self._positions = {}
+        self._levels = []
+        for key, count in counts.items():
+            self._place(key, count)
+        for _, keys in self._reservations.values():
+            for key in keys:
+                self.adjust(key, 1)
+
+    def add(self, key, count=0):
+        if key not in self._counts:
+            self._place(key, count)
+
+    def discard(self, key):
+        if key in self._counts:
+            self._unplace(key)
+
+    def adjust(self, key, delta):
+        """Changes a tracked participant's count; untracked keys are ignored."""
+        if key in self._counts:
+            self._place(key, max(0, self._unplace(key) + delta))
+
+    # --- Reservations ---
+
+    def _expire(self, now):
+        while self._expiry_queue and self._expiry_queue[0][0] <= now:
+            expires_at, rater = self._expiry_queue.popleft()
+            reservation = self._reservations.get(rater)
+            if reservation and reservation[0] == expires_at:
+                self.release(rater)
+
+    def release(self, rater):
+        """Drops the players reserved for a rater (e.g. once their ratings are stored)."""
+        reservation = self._reservations.pop(rater, None)
+        if reservation:
+            for key in reservation[1]:
+                self.adjust(key, -1)
+
+    # --- Picking ---
+
+    def _sample(self, bucket, n, exclude):
+        # Up to n random keys of a bucket that are not excluded
+        if len(bucket) <= 2 * (n + len(exclude)):
+            # Small bucket: filtering all of it costs no more than sampling
+            candidates = [key for key in bucket if key not in exclude]
+            if len(candidates) > n:
+                return self._rng.sample(candidates, n)
+            self._rng.shuffle(candidates)
+            return candidates
+        # Large bucket: draw random slots and reject repeats and excluded keys. At least
+        # half the slots are acceptable, so this takes about 2n draws at most on average
+        chosen = set()
+        candidates = []
+        while len(candidates) < n:
+            index = self._rng.randrange(len(bucket))
+            if index in chosen:
+                continue
+            chosen.add(index)
+            if bucket[index] not in exclude:
+                candidates.append(bucket[index])
+        return candidates
+
+    def pick(self, k, exclude=(), reserve_for=None):
+        """
+        Returns up to k keys with the lowest effective counts, ties broken randomly.
+
+        :param exclude: Keys that must not be picked (e.g. the rater themself)
+        :param reserve_for: If given, the picked keys are reserved for this rater,
+                            replacing any earlier reservation they had
+        """
+        self._expire(time.monotonic())
+        if reserve_for is not None:
+            self.release(reserve_for)
+
+        picked = []
+        for level in list(self._levels):
+            picked.extend(self._sample(self._buckets[level], k - len(picked), exclude))
+            if len(picked) >= k:
+                break
+
+        if reserve_for is not None and picked:
+            expires_at = time.monotonic() + self.reservation_ttl
+            self._reservations[reserve_for] = (expires_at, picked)
+            self._expiry_queue.append((expires_at, reserve_for))
+            for key in picked:
+                self.adjust(key, 1)
+        return picked
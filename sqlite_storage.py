@@ -0,0 +1,266 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from metrics import record_io
+from storage import HISTORY_CHECKPOINT_EVERY, MATCH_FIELDS, MEMBER_SEPARATOR, PARTICIPANT_FIELDS, RATING_FIELDS, \
+    RatingStore, normalize_name
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS participants (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    rating TEXT NOT NULL DEFAULT ''
+);
+CREATE UNIQUE INDEX IF NOT EXISTS participants_name_key ON participants (name_key);
+
+CREATE TABLE IF NOT EXISTS ratings (
+    id INTEGER PRIMARY KEY,
+    rater TEXT NOT NULL,
+    rated_player TEXT NOT NULL,
+    rating TEXT NOT NULL,
+    rater_key TEXT NOT NULL,
+    rated_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ratings_rated_key ON ratings (rated_key);
+CREATE INDEX IF NOT EXISTS ratings_pair ON ratings (rater_key, rated_key);
+
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    match_id TEXT NOT NULL UNIQUE,
+    home TEXT NOT NULL,
+    away TEXT NOT NULL,
+    home_goals INTEGER NOT NULL,
+    away_goals INTEGER NOT NULL
+);
+
+-- Every operation, so other workers can catch up incrementally
+CREATE TABLE IF NOT EXISTS ops (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL
+);
+
+-- The data as CSV right after some of the ops, for restoring earlier versions
+CREATE TABLE IF NOT EXISTS checkpoints (
+    seq INTEGER PRIMARY KEY,
+    participants BLOB NOT NULL,
+    ratings BLOB NOT NULL,
+    matches BLOB NOT NULL
+);
+"""
+
+
+class SQLiteRatingStore(RatingStore):
+    """
+    RatingStore persisted in a SQLite database instead of participants.csv / ratings.csv.
+
+    The in-memory indexes are the same as for the CSV store, so routes behave identically.
+    Names are matched on a name_key column holding the Python-normalized name (SQLite's
+    lower() only folds ASCII), with indexes on it, on rated_key and on (rater_key,
+    rated_key). The database runs in WAL mode so workers read while another one writes;
+    writes take SQLite's own write lock (BEGIN IMMEDIATE) instead of storage.lock.
+    """
+
+    def __init__(self, db_path, reservation_ttl=600, history=True):
+        super().__init__(reservation_ttl=reservation_ttl, history=history)
+        self.db_path = db_path
+        self._conn = None
+        self._loaded = False
+
+    def _connection(self):
+        # Opened lazily so every gunicorn worker gets its own connection after forking
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    # --- Loading ---
+
+    def refresh(self):
+        with self._lock:
+            conn = self._connection()
+            if not self._loaded:
+                self._load()
+                return
+            (latest,) = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM ops').fetchone()
+            if latest > self._seq:
+                self._replay_ops()
+
+    def _load(self):
+        conn = self._connection()
+        in_transaction = conn.in_transaction
+        if not in_transaction:
+            conn.execute('BEGIN')  # One consistent read snapshot
+        try:
+            participant_rows = [{'name': name, 'rating': rating} for name, rating in
+                                conn.execute('SELECT name, rating FROM participants ORDER BY id')]
+            rating_rows = [{'rater': rater, 'rated_player': rated_player, 'rating': rating}
+                           for rater, rated_player, rating in
+                           conn.execute('SELECT rater, rated_player, rating FROM ratings ORDER BY id')]
+            match_rows = [{'match_id': match_id, 'home': home, 'away': away,
+                           'home_goals': str(home_goals), 'away_goals': str(away_goals)}
+                          for match_id, home, away, home_goals, away_goals in
+                          conn.execute('SELECT match_id, home, away, home_goals, away_goals FROM matches ORDER BY id')]
+            (self._seq,) = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM ops').fetchone()
+        finally:
+            if not in_transaction:
+                conn.execute('COMMIT')
+        record_io(rows_parsed=len(participant_rows) + len(rating_rows) + len(match_rows))
+        self._set_state(participant_rows, rating_rows, match_rows)
+        self._loaded = True
+
+    def _replay_ops(self):
+        rows = self._connection().execute('SELECT seq, op FROM ops WHERE seq > ? ORDER BY seq', (self._seq,)).fetchall()
+        record_io(rows_parsed=len(rows))
+        for seq, op in rows:
+            op = json.loads(op)
+            if op['op'] in ('reload', 'restore'):
+                # Data was replaced wholesale (by an import or a restore)
+                self._load()
+                return
+            self._apply(op)
+            self._seq = seq
+
+    # --- Persistence ---
+
+    @contextmanager
+    def _writing(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                self.refresh()
+                yield
+            except BaseException:
+                conn.execute('ROLLBACK')
+                self._loaded = False  # Memory may be ahead of the database now
+                raise
+            conn.execute('COMMIT')
+
+    def _commit(self, op):
+        conn = self._connection()
+        if self.history and not self._has_checkpoint():
+            self._write_checkpoint()  # The data as it was before its first recorded change
+        op = dict(op, time=round(time.time(), 3))
+        op_json = json.dumps(op, ensure_ascii=False)
+        record_io(bytes_written=len(op_json))  # Approximate: the op log row, not table pages
+        self._seq = conn.execute('INSERT INTO ops (op) VALUES (?)', (op_json,)).lastrowid
+        self._apply(dict(op, seq=self._seq))
+        self._execute(op)
+        if self.history and self._seq - max(self._checkpoint_seqs(), default=0) >= HISTORY_CHECKPOINT_EVERY:
+            self._write_checkpoint()
+
+    def _execute(self, op):
+        """Runs the SQL for one operation inside the current write transaction."""
+        conn = self._connection()
+        kind = op['op']
+        if kind == 'batch':
+            for sub_op in op['ops']:
+                self._execute(sub_op)
+        elif kind == 'add_participant':
+            conn.execute('INSERT OR IGNORE INTO participants (name, name_key, rating) VALUES (?, ?, ?)',
+                         (op['name'], normalize_name(op['name']), op.get('rating', '')))
+        elif kind == 'set_self_rating':
+            conn.execute('INSERT INTO participants (name, name_key, rating) VALUES (?, ?, ?) '
+                         'ON CONFLICT (name_key) DO UPDATE SET rating = excluded.rating',
+                         (op['name'], normalize_name(op['name']), str(op['rating'])))
+        elif kind == 'update_participant_rating':
+            conn.execute('UPDATE participants SET rating = ? WHERE name_key = ?',
+                         (str(op['rating']), normalize_name(op['name'])))
+        elif kind == 'remove_participant':
+            key = normalize_name(op['name'])
+            conn.execute('DELETE FROM participants WHERE name_key = ?', (key,))
+            conn.execute('DELETE FROM ratings WHERE rater_key = ? OR rated_key = ?', (key, key))
+        elif kind == 'add_ratings':
+            conn.executemany('INSERT INTO ratings (rater, rated_player, rating, rater_key, rated_key) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             [(op['rater'], rated_player, str(rating), normalize_name(op['rater']),
+                               normalize_name(rated_player)) for rated_player, rating in op['ratings']])
+        elif kind == 'update_rating':
+            conn.execute('UPDATE ratings SET rating = ? WHERE rater_key = ? AND rated_key = ?',
+                         (str(op['rating']), normalize_name(op['rater']), normalize_name(op['rated_player'])))
+        elif kind == 'remove_rating':
+            conn.execute('DELETE FROM ratings WHERE rater_key = ? AND rated_key = ?',
+                         (normalize_name(op['rater']), normalize_name(op['rated_player'])))
+        elif kind == 'record_match':
+            conn.execute('INSERT INTO matches (match_id, home, away, home_goals, away_goals) VALUES (?, ?, ?, ?, ?) '
+                         'ON CONFLICT (match_id) DO UPDATE SET home = excluded.home, away = excluded.away, '
+                         'home_goals = excluded.home_goals, away_goals = excluded.away_goals',
+                         (op['match_id'], MEMBER_SEPARATOR.join(op['home']), MEMBER_SEPARATOR.join(op['away']),
+                          op['home_goals'], op['away_goals']))
+
+    # --- History ---
+
+    def _history_ops(self):
+        return [dict(json.loads(op), seq=seq) for seq, op in
+                self._connection().execute('SELECT seq, op FROM ops ORDER BY seq')]
+
+    def _checkpoint_seqs(self):
+        return [seq for (seq,) in self._connection().execute('SELECT seq FROM checkpoints ORDER BY seq')]
+
+    def _write_checkpoint(self):
+        # Full CSV copies, so one is only written every HISTORY_CHECKPOINT_EVERY operations
+        self._connection().execute(
+            'INSERT OR IGNORE INTO checkpoints (seq, participants, ratings, matches) VALUES (?, ?, ?, ?)',
+            (self._seq, self._serialize(PARTICIPANT_FIELDS, self.participants.values()),
+             self._serialize(RATING_FIELDS, self.ratings.values()),
+             self._serialize(MATCH_FIELDS, self.matches.values())))
+        self._checkpointed = True
+
+    def _read_checkpoint(self, seq):
+        row = self._connection().execute('SELECT participants, ratings, matches FROM checkpoints WHERE seq = ?',
+                                         (seq,)).fetchone()
+        return tuple(self._parse_csv(data) for data in row)
+
+    def _replace_state(self, participant_rows, rating_rows, match_rows, op):
+        conn = self._connection()
+        conn.execute('DELETE FROM participants')
+        conn.execute('DELETE FROM ratings')
+        conn.execute('DELETE FROM matches')
+        conn.executemany('INSERT INTO participants (name, name_key, rating) VALUES (?, ?, ?)',
+                         [(p['name'], normalize_name(p['name']), p['rating']) for p in participant_rows])
+        conn.executemany('INSERT INTO ratings (rater, rated_player, rating, rater_key, rated_key) '
+                         'VALUES (?, ?, ?, ?, ?)',
+                         [(r['rater'], r['rated_player'], r['rating'], normalize_name(r['rater']),
+                           normalize_name(r['rated_player'])) for r in rating_rows])
+        conn.executemany('INSERT INTO matches (match_id, home, away, home_goals, away_goals) VALUES (?, ?, ?, ?, ?)',
+                         [(m['match_id'], m['home'], m['away'], int(m['home_goals']), int(m['away_goals']))
+                          for m in match_rows])
+        conn.execute('INSERT INTO ops (op) VALUES (?)', (json.dumps(dict(op, time=round(time.time(), 3))),))
+        self._load()
+        if self.history:
+            self._write_checkpoint()
+
+    def data_version(self):
+        self.refresh()
+        return str(self._seq)  # The ops log records every change, imports included
+
+    def last_modified(self):
+        times = [os.stat(path).st_mtime for path in (self.db_path, self.db_path + '-wal') if os.path.exists(path)]
+        return max(times, default=0.0)
+
+    def compact(self):
+        pass  # Nothing to fold: every operation is written straight to its table
+
+    # --- Import ---
+
+    def import_csv(self, data_dir):
+        """
+        One-shot import of participants.csv / ratings.csv / matches.csv (plus any journal)
+        from data_dir, replacing everything currently in the database.
+
+        :return: Tuple of (participants imported, ratings imported)
+        """
+        source = RatingStore(data_dir)
+        source.refresh()
+        participants = source.participant_rows()
+        ratings = source.rating_rows()
+        matches = source.match_rows()
+        with self._writing():
+            self._replace_state(participants, ratings, matches, {'op': 'reload'})
+        return len(participants), len(ratings)
@@ -0,0 +1,1169 @@
+import csv
+import hashlib
+import io
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import scoring
+from elo import EloRatings
+from fileutil import atomic_write, file_stamp, flock, read_bytes
+from metrics import record_io
+from selection import LeastRatedPicker
+
+PARTICIPANT_FIELDS = ['name', 'rating']
+RATING_FIELDS = ['rater', 'rated_player', 'rating']
+# home / away hold the team's player names separated by MEMBER_SEPARATOR
+MATCH_FIELDS = ['match_id', 'home', 'away', 'home_goals', 'away_goals']
+MEMBER_SEPARATOR = ';'
+
+PARTICIPANTS_FILE = 'participants.csv'
+RATINGS_FILE = 'ratings.csv'
+MATCHES_FILE = 'matches.csv'
+# Append-only log of operations applied on top of the CSV snapshot
+JOURNAL_FILE = 'journal.jsonl'
+# Records which journal sequence number each CSV snapshot includes
+SNAPSHOT_META_FILE = 'snapshot.json'
+# flock()ed to serialize writers across gunicorn workers
+LOCK_FILE = 'storage.lock'
+# Recently applied operations kept in memory for live updates
+EVENT_LOG_SIZE = 1000
+# Every operation ever applied (ops.jsonl) plus copies of the data at some of them
+# (checkpoints/<seq>/), for comparing and restoring earlier versions
+HISTORY_DIR = 'history'
+HISTORY_OPS_FILE = 'ops.jsonl'
+CHECKPOINTS_DIR = 'checkpoints'
+# A checkpoint is kept at least every this many operations; the versions in between are
+# rebuilt from the checkpoint before them plus the operations after it
+HISTORY_CHECKPOINT_EVERY = 1000
+
+
+def normalize_name(name):
+    return (name or '').strip().lower()
+
+
+def parse_rating(value):
+    """
+    Parses a rating the same way the routes always have: int(float(value)) within 1..5.
+
+    :return: The rating as an int, or None if it is empty or invalid
+    """
+    value = str(value if value is not None else '').strip()
+    if not value:
+        return None
+    try:
+        rating = int(float(value))
+    except ValueError:
+        return None
+    if 1 <= rating <= 5:
+        return rating
+    return None
+
+
+class NameIds:
+    """
+    Interns player names to small integer ids. Each distinct spelling is normalized once
+    and every row naming that player shares one string object.
+    """
+
+    __slots__ = ('keys', '_ids', '_spellings')
+
+    def __init__(self):
+        self.keys = []  # id -> normalized name
+        self._ids = {}  # normalized name -> id
+        self._spellings = {}  # name as written -> (shared name string, id)
+
+    def intern(self, name):
+        """
+        :return: Tuple of (the name as a shared string, the player's id)
+        """
+        entry = self._spellings.get(name)
+        if entry is None:
+            key = normalize_name(name)
+            name_id = self._ids.get(key)
+            if name_id is None:
+                name_id = self._ids[key] = len(self.keys)
+                self.keys.append(key)
+            entry = self._spellings[name] = (name, name_id)
+        return entry
+
+    def id_of(self, name):
+        """:return: The id of a name seen before (in any spelling), or None"""
+        entry = self._spellings.get(name)
+        if entry is not None:
+            return entry[1]
+        return self._ids.get(normalize_name(name))
+
+    def id_of_key(self, key):
+        """Like id_of() for an already normalized name."""
+        return self._ids.get(key)
+
+
+class Rating:
+    """
+    One row of ratings.csv. Names are shared strings and the score is parsed once;
+    rater_id / rated_id are the players' NameIds ids, used by every index.
+    """
+
+    __slots__ = ('rater', 'rated_player', 'rating', 'score', 'rater_id', 'rated_id')
+
+    def __init__(self, rater, rated_player, rating, rater_id, rated_id):
+        self.rater = rater
+        self.rated_player = rated_player
+        self.rating = rating
+        self.score = parse_rating(rating)
+        self.rater_id = rater_id
+        self.rated_id = rated_id
+
+    def __getitem__(self, field):
+        # Readable like the csv.DictReader rows it replaces, e.g. rating['rater'] in templates
+        return getattr(self, field)
+
+
+class ScoreStats:
+    """Running count, sum and 1..5 histogram of one player's scores, so the median is O(1)."""
+
+    __slots__ = ('count', 'total', 'histogram')
+
+    def __init__(self, count=0, total=0, histogram=None):
+        self.count = count
+        self.total = total
+        self.histogram = histogram or [0] * 6  # Index 0 is unused
+
+    def add(self, score, weight=1):
+        self.count += weight
+        self.total += score * weight
+        self.histogram[score] += weight
+
+    def remove(self, score):
+        self.add(score, -1)
+
+    def with_score(self, score):
+        """Copy of these stats with one extra score (e.g. the self-rating) mixed in."""
+        stats = ScoreStats(self.count, self.total, list(self.histogram))
+        if score is not None:
+            stats.add(score)
+        return stats
+
+    def _nth(self, n):
+        # n-th smallest score (0-based), found by walking the cumulative histogram
+        for score in range(1, 6):
+            n -= self.histogram[score]
+            if n < 0:
+                return score
+        raise IndexError(n)
+
+    def average(self):
+        return round(self.total / self.count, 2) if self.count else 'N/A'
+
+    def median(self):
+        """Same result as statistics.median() over the raw scores."""
+        if not self.count:
+            return 'N/A'
+        if self.count % 2:
+            return self._nth(self.count // 2)
+        return round((self._nth(self.count // 2 - 1) + self._nth(self.count // 2)) / 2, 2)
+
+
+def _diff_rows(current, restored):
+    # Rows keyed the same way in both versions, compared as restoring would change them
+    return {
+        'added': [row for key, row in restored.items() if key not in current],
+        'removed': [row for key, row in current.items() if key not in restored],
+        'changed': [(row, restored[key]) for key, row in current.items()
+                    if key in restored and restored[key] != row],
+    }
+
+
+
+_EMPTY_STATS = ScoreStats()
+
+
+class RatingStore:
+    """
+    In-memory, indexed view of participants.csv and ratings.csv.
+
+    The CSV files are a snapshot; in journaled mode every mutation is appended as a single
+    JSON line to journal.jsonl and the snapshot is rewritten (atomically) only every
+    `compact_every` operations. Files are parsed once and afterwards only the new tail of
+    the journal is replayed, so read-only routes never rescan the CSVs.
+
+    Mutations hold an exclusive flock() on storage.lock for their whole
+    refresh-apply-append cycle, so concurrent workers never lose each other's updates.
+    Readers take no lock except a shared one while reloading the full snapshot.
+    """
+
+    def __init__(self, data_dir='.', journal=True, compact_every=1000, reservation_ttl=600, history=True):
+        self.data_dir = data_dir
+        self.participants_path = os.path.join(data_dir, PARTICIPANTS_FILE)
+        self.ratings_path = os.path.join(data_dir, RATINGS_FILE)
+        self.matches_path = os.path.join(data_dir, MATCHES_FILE)
+        self.journal_path = os.path.join(data_dir, JOURNAL_FILE)
+        self.meta_path = os.path.join(data_dir, SNAPSHOT_META_FILE)
+        self.lock_path = os.path.join(data_dir, LOCK_FILE)
+        self.history_dir = os.path.join(data_dir, HISTORY_DIR)
+        self.journal = journal
+        self.compact_every = compact_every
+        self.history = history
+        self._checkpointed = False  # Whether the history is known to have a checkpoint
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+        self._stamps = None  # Stamps of (participants, ratings, matches) when last loaded
+        self._journal_stamp = None
+        self._journal_offset = 0  # Bytes of the journal already replayed
+        self._journal_ops = 0  # Operations in the journal since the last compaction
+        self._seq = 0  # Highest journal sequence number applied
+        # File name -> (seq, sha1) of the snapshot currently on disk
+        self._snapshot = {}
+
+        # Integer ids of every participant and every name in the ratings and matches; kept
+        # across reloads, so ids held elsewhere (e.g. by reservations) stay valid
+        self.names = NameIds()
+        # participant id -> {'name': ..., 'rating': ...}, in file order
+        self.participants = {}
+        # row id -> Rating, in file order
+        self.ratings = {}
+        self._next_row_id = 0
+        # Indexes over self.ratings by player id: id (or (rater id, rated id)) -> {row id: Rating}
+        self.by_rated = defaultdict(dict)
+        self.by_rater = defaultdict(dict)
+        self.by_pair = defaultdict(dict)
+        # rated player id -> ScoreStats of valid ratings received
+        self.received_stats = defaultdict(ScoreStats)
+        # Times rated per participant id, for handing out the least-rated players to rate
+        self.least_rated = LeastRatedPicker(reservation_ttl)
+        # match id -> {'match_id': ..., 'home': ..., 'away': ..., 'home_goals': ..., 'away_goals': ...},
+        # in the order the results came in
+        self.matches = {}
+        # Match-based strength per player id, updated as each result comes in
+        self.elo = EloRatings()
+        # (event id, op) of the latest operations applied in this process, whether written
+        # here or replayed from another worker; a full reload is logged as a 'reload' op
+        self.events = deque(maxlen=EVENT_LOG_SIZE)
+        self._event_id = 0
+        # batch_id of the latest submission batches in the loaded data (see submit_ratings())
+        self._batch_ids = deque(maxlen=EVENT_LOG_SIZE)
+
+    # --- Locking ---
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        """
+        Holds the cross-process lock on storage.lock. Re-entrant within this store, where
+        the outermost caller decides whether the lock is shared or exclusive.
+        """
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            if self._lock_file is None:
+                self._lock_file = open(self.lock_path, 'a+b')
+            with flock(self._lock_file, exclusive):
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+
+    @contextmanager
+    def _writing(self):
+        # Every mutation runs against the latest on-disk state while holding the write lock
+        with self._file_lock(exclusive=True):
+            self.refresh()
+            try:
+                yield
+            except BaseException:
+                # Memory may hold an operation that never reached the journal, or the journal
+                # a line that was written before its fsync failed; reload both from disk
+                self._stamps = None
+                raise
+
+    # --- Loading ---
+
+    def refresh(self):
+        """Catches up with changes made on disk (e.g. by another gunicorn worker)."""
+        with self._lock:
+            stamps = self._file_stamps()
+            journal_stamp = file_stamp(self.journal_path)
+            if stamps != self._stamps:
+                self._load()
+            elif journal_stamp != self._journal_stamp:
+                if journal_stamp is None or self._journal_stamp is None \
+                        or journal_stamp[0] != self._journal_stamp[0] or journal_stamp[2] < self._journal_offset:
+                    # Journal was replaced by a compaction
+                    self._load()
+                else:
+                    self._replay_journal()
+
+    def _file_stamps(self):
+        return tuple(file_stamp(path) for path in (self.participants_path, self.ratings_path, self.matches_path))
+
+    def _load(self):
+        with self._file_lock(exclusive=False):
+            self._load_snapshot()
+
+    def _load_snapshot(self):
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                record_io(file_opens=1)
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            meta = {}
+
+        participants_data = read_bytes(self.participants_path)
+        ratings_data = read_bytes(self.ratings_path)
+        matches_data = read_bytes(self.matches_path)
+        self._snapshot = {
+            PARTICIPANTS_FILE: self._snapshot_version(meta.get(PARTICIPANTS_FILE), participants_data),
+            RATINGS_FILE: self._snapshot_version(meta.get(RATINGS_FILE), ratings_data),
+            MATCHES_FILE: self._snapshot_version(meta.get(MATCHES_FILE), matches_data),
+        }
+        self._stamps = self._file_stamps()
+
+        self._set_state(self._parse_csv(participants_data), self._parse_csv(ratings_data),
+                        self._parse_csv(matches_data))
+
+        self._seq = max(version[0] for version in self._snapshot.values())
+        self._journal_offset = 0
+        self._journal_ops = 0
+        self._replay_journal()
+
+    def _set_state(self, participant_rows, rating_rows, match_rows=()):
+        """Rebuilds the in-memory state and every index from raw participant, rating and match rows."""
+        self.participants = {}
+        for row in participant_rows:
+            name = (row.get('name') or '').strip()
+            if not name:
+                continue
+            name_id = self.names.intern(name)[1]
+            if name_id not in self.participants:
+                self.participants[name_id] = {'name': name, 'rating': (row.get('rating') or '').strip()}
+
+        self.ratings = {}
+        self.by_rated = defaultdict(dict)
+        self.by_rater = defaultdict(dict)
+        self.by_pair = defaultdict(dict)
+        self.received_stats = defaultdict(ScoreStats)
+        for row in rating_rows:
+            self._index_rating((row.get('rater') or '').strip(), (row.get('rated_player') or '').strip(),
+                               (row.get('rating') or '').strip())
+
+        self.least_rated.rebuild({name_id: len(self.by_rated.get(name_id, ())) for name_id in self.participants})
+
+        self.matches = {}
+        for row in match_rows:
+            match_id = (row.get('match_id') or '').strip()
+            if match_id:
+                self.matches[match_id] = {field: (row.get(field) or '').strip() for field in MATCH_FIELDS}
+        self.elo.rebuild(self._match_result(row) for row in self.matches.values())
+        self._batch_ids.clear()
+        self._log_event({'op': 'reload'})
+
+    @staticmethod
+    def _snapshot_version(meta, data):
+        """
+        Works out which journal sequence number a CSV snapshot includes.
+
+        Compaction records the new snapshot's hash before renaming it into place, so a
+        crash in between leaves a file matching either the new or the previous hash.
+        """
+        sha1 = hashlib.sha1(data or b'').hexdigest()
+        if not meta:
+            return (0, sha1)
+        if sha1 == meta.get('previous_sha1'):
+            return (meta.get('previous_seq', 0), sha1)
+        # Matches the latest snapshot, or was edited by hand on top of it
+        return (meta.get('seq', 0), sha1)
+
+    @staticmethod
+    def _parse_csv(data):
+        if not data:
+            return []
+        rows = list(csv.DictReader(io.StringIO(data.decode('utf-8'), newline='')))
+        record_io(rows_parsed=len(rows))
+        return rows
+
+    def _replay_journal(self):
+        participants_seq = self._snapshot[PARTICIPANTS_FILE][0]
+        ratings_seq = self._snapshot[RATINGS_FILE][0]
+        matches_seq = self._snapshot[MATCHES_FILE][0]
+        try:
+            with open(self.journal_path, 'rb') as f:
+                record_io(file_opens=1)
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            self._journal_stamp = None
+            return
+        # Only consume complete lines; a torn last line is left for the next writer to clean up
+        end = data.rfind(b'\n') + 1
+        lines = data[:end].splitlines()
+        record_io(rows_parsed=len(lines))
+        for line in lines:
+            try:
+                op = json.loads(line)
+            except ValueError:
+                continue
+            seq = op.get('seq', 0)
+            if seq <= participants_seq and seq <= ratings_seq and seq <= matches_seq:
+                continue  # Already part of every snapshot
+            self._apply(op, participants=seq > participants_seq, ratings=seq > ratings_seq,
+                        matches=seq > matches_seq)
+            self._seq = max(self._seq, seq)
+            self._journal_ops += 1
+        self._journal_offset += end
+        self._journal_stamp = file_stamp(self.journal_path)
+
+    def _index_rating(self, rater, rated_player, rating):
+        row_id = self._next_row_id
+        self._next_row_id += 1
+        rater, rater_id = self.names.intern(rater)
+        rated_player, rated_id = self.names.intern(rated_player)
+        row = Rating(rater, rated_player, rating, rater_id, rated_id)
+        self.ratings[row_id] = row
+        self.by_rated[rated_id][row_id] = row
+        self.by_rater[rater_id][row_id] = row
+        self.by_pair[(rater_id, rated_id)][row_id] = row
+        self.least_rated.adjust(rated_id, 1)
+        if row.score is not None:
+            self.received_stats[rated_id].add(row.score)
+
+    def _unindex_rating(self, row_id):
+        row = self.ratings.pop(row_id)
+        rater_id, rated_id = row.rater_id, row.rated_id
+        self.least_rated.adjust(rated_id, -1)
+        if row.score is not None:
+            self.received_stats[rated_id].remove(row.score)
+            if not self.received_stats[rated_id].count:
+                del self.received_stats[rated_id]
+        for index, key in ((self.by_rated, rated_id), (self.by_rater, rater_id), (self.by_pair, (rater_id, rated_id))):
+            rows = index[key]
+            rows.pop(row_id, None)
+            if not rows:
+                del index[key]
+
+    def _set_row_rating(self, row, rating):
+        rated_id = row.rated_id
+        if row.score is not None:
+            self.received_stats[rated_id].remove(row.score)
+        row.rating = str(rating)
+        row.score = parse_rating(row.rating)
+        if row.score is not None:
+            self.received_stats[rated_id].add(row.score)
+        if not self.received_stats[rated_id].count:
+            del self.received_stats[rated_id]
+
+    def _pair_rows(self, rater, rated_player):
+        """:return: {row id: Rating} of every rating from rater to rated_player"""
+        return self.by_pair.get((self.names.id_of(rater), self.names.id_of(rated_player)), {})
+
+    def _add_participant(self, name_id, name, rating):
+        self.participants[name_id] = {'name': name, 'rating': rating}
+        self.least_rated.add(name_id, len(self.by_rated.get(name_id, ())))
+
+    # --- Operations ---
+
+    def _apply(self, op, participants=True, ratings=True, matches=True):
+        """
+        Applies one journal operation to the in-memory state.
+
+        :param participants: Whether to apply it to participants (False while replaying an
+                             operation participants.csv already includes); likewise for
+                             ratings and matches
+        """
+        kind = op['op']
+        if kind != 'batch':
+            self._log_event(op)
+        if kind == 'batch':
+            # Several operations committed as one journal line, so they land all or nothing
+            if 'batch_id' in op:
+                self._batch_ids.append(op['batch_id'])
+            for sub_op in op['ops']:
+                self._apply(sub_op, participants=participants, ratings=ratings, matches=matches)
+        elif kind == 'add_participant':
+            if participants:
+                name_id = self.names.intern(op['name'])[1]
+                if name_id not in self.participants:
+                    self._add_participant(name_id, op['name'], op.get('rating', ''))
+        elif kind == 'set_self_rating':
+            if participants:
+                name_id = self.names.intern(op['name'])[1]
+                if name_id in self.participants:
+                    self.participants[name_id]['rating'] = str(op['rating'])
+                else:
+                    self._add_participant(name_id, op['name'], str(op['rating']))
+        elif kind == 'update_participant_rating':
+            participant = self.participants.get(self.names.id_of(op['name']))
+            if participants and participant is not None:
+                participant['rating'] = str(op['rating'])
+        elif kind == 'remove_participant':
+            name_id = self.names.id_of(op['name'])
+            if participants:
+                self.participants.pop(name_id, None)
+                self.least_rated.discard(name_id)
+            if ratings:
+                row_ids = set(self.by_rater.get(name_id, {})) | set(self.by_rated.get(name_id, {}))
+                for row_id in row_ids:
+                    self._unindex_rating(row_id)
+        elif kind == 'add_ratings':
+            if ratings:
+                for rated_player, rating in op['ratings']:
+                    self._index_rating(op['rater'], rated_player, str(rating))
+        elif kind == 'update_rating':
+            rows = self._pair_rows(op['rater'], op['rated_player'])
+            if ratings:
+                for row in rows.values():
+                    self._set_row_rating(row, op['rating'])
+        elif kind == 'remove_rating':
+            rows = self._pair_rows(op['rater'], op['rated_player'])
+            if ratings:
+                for row_id in list(rows):
+                    self._unindex_rating(row_id)
+        elif kind == 'record_match':
+            if matches:
+                row = {
+                    'match_id': str(op['match_id']),
+                    'home': MEMBER_SEPARATOR.join(op['home']),
+                    'away': MEMBER_SEPARATOR.join(op['away']),
+                    'home_goals': str(op['home_goals']),
+                    'away_goals': str(op['away_goals']),
+                }
+                if row['match_id'] in self.matches:
+                    # A corrected result changes every rating update after it, so replay them all
+                    self.matches[row['match_id']] = row
+                    self.elo.rebuild(self._match_result(match) for match in self.matches.values())
+                else:
+                    self.matches[row['match_id']] = row
+                    self.elo.record(*self._match_result(row))
+
+    def _match_result(self, row):
+        # (home player ids, away player ids, home goals, away goals) of a stored match row
+        def ids(team):
+            return [self.names.intern(name)[1] for name in team.split(MEMBER_SEPARATOR) if name.strip()]
+        return ids(row['home']), ids(row['away']), int(row['home_goals']), int(row['away_goals'])
+
+    def _log_event(self, op):
+        self._event_id += 1
+        self.events.append((self._event_id, op))
+
+    def _commit(self, op):
+        """Applies an operation in memory and persists it (journal append or snapshot rewrite)."""
+        if self.history and not self._has_checkpoint():
+            # The history starts from a copy of the data as it was before its first change
+            self._compact(checkpoint=True)
+        self._seq += 1
+        op = dict(op, seq=self._seq, time=round(time.time(), 3))
+        self._apply(op)
+        if not self.journal:
+            self._compact(archive=[op])
+            return
+        self._append_journal(op)
+        if self._journal_ops >= self.compact_every:
+            self._compact()
+
+    def _append_journal(self, op):
+        line = (json.dumps(op, ensure_ascii=False) + '\n').encode('utf-8')
+        with open(self.journal_path, 'ab') as f:
+            if f.tell() > self._journal_offset:
+                # A previous writer died mid-line; drop the torn tail before appending
+                f.truncate(self._journal_offset)
+            record_io(file_opens=1, bytes_written=len(line))
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_offset += len(line)
+        self._journal_ops += 1
+        self._journal_stamp = file_stamp(self.journal_path)
+
+    def _serialize(self, fieldnames, rows):
+        # Rows are dicts or Rating records, so fields are read by key rather than with DictWriter
+        output = io.StringIO(newline='')
+        writer = csv.writer(output)
+        writer.writerow(fieldnames)
+        for row in rows:
+            writer.writerow([row[field] for field in fieldnames])
+        return output.getvalue().encode('utf-8')
+
+    def _compact(self, checkpoint=False, archive=()):
+        """
+        Writes the current state as the new CSV snapshot and empties the journal, moving
+        the journal's operations to the history first.
+
+        :param checkpoint: Keep this snapshot as a history checkpoint even if the last one is recent
+        :param archive: Operations to add to the history that are not in the journal
+        """
+        if self.history:
+            self._archive_ops(archive)
+        snapshots = (
+            (PARTICIPANTS_FILE, self.participants_path, self._serialize(PARTICIPANT_FIELDS, self.participants.values())),
+            (RATINGS_FILE, self.ratings_path, self._serialize(RATING_FIELDS, self.ratings.values())),
+            (MATCHES_FILE, self.matches_path, self._serialize(MATCH_FIELDS, self.matches.values())),
+        )
+        meta = {}
+        for file_name, _, data in snapshots:
+            previous_seq, previous_sha1 = self._snapshot.get(file_name, (0, None))
+            meta[file_name] = {
+                'seq': self._seq,
+                'sha1': hashlib.sha1(data).hexdigest(),
+                'previous_seq': previous_seq,
+                'previous_sha1': previous_sha1,
+            }
+        atomic_write(self.meta_path, json.dumps(meta, indent=2).encode('utf-8'))
+        for file_name, path, data in snapshots:
+            atomic_write(path, data)
+            self._snapshot[file_name] = (self._seq, meta[file_name]['sha1'])
+        atomic_write(self.journal_path, b'')
+
+        self._stamps = self._file_stamps()
+        self._journal_stamp = file_stamp(self.journal_path)
+        self._journal_offset = 0
+        self._journal_ops = 0
+        if self.history and (checkpoint or self._seq - max(self._checkpoint_seqs(), default=0)
+                             >= HISTORY_CHECKPOINT_EVERY):
+            self._write_checkpoint()
+
+    # --- History ---
+
+    def _archive_ops(self, extra=()):
+        # Appends the journal's complete lines, then the extra operations, to the history log.
+        # A crash before the journal is emptied archives them twice; readers skip repeated seqs.
+        journal = read_bytes(self.journal_path) or b''
+        data = journal[:journal.rfind(b'\n') + 1] + b''.join(
+            (json.dumps(op, ensure_ascii=False) + '\n').encode('utf-8') for op in extra)
+        if not data:
+            return
+        os.makedirs(self.history_dir, exist_ok=True)
+        with open(os.path.join(self.history_dir, HISTORY_OPS_FILE), 'ab') as f:
+            record_io(file_opens=1, bytes_written=len(data))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _history_ops(self):
+        """Every operation in the history, oldest first, each with its 'seq'."""
+        with self._file_lock(exclusive=False):
+            data = (read_bytes(os.path.join(self.history_dir, HISTORY_OPS_FILE)) or b'') + \
+                   (read_bytes(self.journal_path) or b'')
+        ops = []
+        for line in data.splitlines():
+            try:
+                op = json.loads(line)
+            except ValueError:
+                continue  # Torn last line of the journal
+            if op.get('seq', 0) > (ops[-1]['seq'] if ops else 0):
+                ops.append(op)
+        return ops
+
+    def _checkpoint_seqs(self):
+        try:
+            names = os.listdir(os.path.join(self.history_dir, CHECKPOINTS_DIR))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def _has_checkpoint(self):
+        if not self._checkpointed:
+            self._checkpointed = bool(self._checkpoint_seqs())
+        return self._checkpointed
+
+    def _write_checkpoint(self):
+        """
+        Keeps the snapshot just written by _compact() as the checkpoint for self._seq.
+
+        The files are hard-linked rather than copied: snapshots are always replaced by
+        renaming a new file over them, never edited in place, so the linked files keep
+        this version's content at no copying cost.
+        """
+        checkpoints_dir = os.path.join(self.history_dir, CHECKPOINTS_DIR)
+        target = os.path.join(checkpoints_dir, str(self._seq))
+        if os.path.exists(target):
+            return
+        tmp_dir = target + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for path in (self.participants_path, self.ratings_path, self.matches_path):
+            link_path = os.path.join(tmp_dir, os.path.basename(path))
+            try:
+                os.link(path, link_path)
+            except OSError:  # e.g. a file system without hard links
+                shutil.copyfile(path, link_path)
+        os.rename(tmp_dir, target)
+        self._checkpointed = True
+
+    def _read_checkpoint(self, seq):
+        """:return: Tuple of (participant rows, rating rows, match rows) of a checkpoint"""
+        checkpoint_dir = os.path.join(self.history_dir, CHECKPOINTS_DIR, str(seq))
+        return tuple(self._parse_csv(read_bytes(os.path.join(checkpoint_dir, file_name)))
+                     for file_name in (PARTICIPANTS_FILE, RATINGS_FILE, MATCHES_FILE))
+
+    def _replace_state(self, participant_rows, rating_rows, match_rows, op):
+        """Replaces all data with the given rows as one new operation (e.g. a restore)."""
+        self._set_state(participant_rows, rating_rows, match_rows)
+        self._seq += 1
+        self._compact(checkpoint=True, archive=[dict(op, seq=self._seq, time=round(time.time(), 3))])
+
+    def _state_at(self, seq):
+        """
+        Rebuilds the data as it was right after operation seq, from the latest checkpoint
+        at or before it plus the operations in between.
+
+        :return: A RatingStore holding that version in memory only
+        """
+        if seq > self._seq:
+            raise ValueError(f'Version {seq} does not exist yet')
+        base = max((checkpoint for checkpoint in self._checkpoint_seqs() if checkpoint <= seq), default=None)
+        if base is None:
+            raise ValueError(f'Version {seq} is older than the history kept')
+        state = RatingStore(journal=False, history=False)
+        state._set_state(*self._read_checkpoint(base))
+        for op in self._history_ops():
+            if base < op['seq'] <= seq:
+                state._apply(op)
+        return state
+
+    def _participants_by_key(self):
+        # Participants keyed by normalized name, since another store's ids differ
+        keys = self.names.keys
+        return {keys[name_id]: participant for name_id, participant in self.participants.items()}
+
+    def _rating_pairs(self):
+        # Ratings keyed by (rater, rated player, n-th rating of that pair), for comparing versions
+        keys = self.names.keys
+        pairs = {}
+        counts = defaultdict(int)
+        for row in self.ratings.values():
+            pair = (keys[row.rater_id], keys[row.rated_id])
+            pairs[pair + (counts[pair],)] = {'rater': row.rater, 'rated_player': row.rated_player,
+                                             'rating': row.rating}
+            counts[pair] += 1
+        return pairs
+
+    def export_csv(self, kind):
+        """
+        Current participants, ratings or match results serialized as CSV, including journaled edits.
+
+        :param kind: 'participants', 'ratings' or 'matches'
+        :return: CSV file content as bytes
+        """
+        with self._lock:
+            self.refresh()
+            if kind == 'participants':
+                return self._serialize(PARTICIPANT_FIELDS, self.participants.values())
+            if kind == 'matches':
+                return self._serialize(MATCH_FIELDS, self.matches.values())
+            return self._serialize(RATING_FIELDS, self.ratings.values())
+
+    def data_version(self):
+        """
+        Identifies the data currently loaded. Workers that have caught up with the same
+        journal entries on top of the same CSV snapshot return the same string, and any
+        write (or hand edit of the CSVs) changes it.
+        """
+        with self._lock:
+            self.refresh()
+            return '-'.join([str(self._seq)] + [self._snapshot[file_name][1][:12]
+                                                for file_name in (PARTICIPANTS_FILE, RATINGS_FILE, MATCHES_FILE)])
+
+    def last_modified(self):
+        """Time of the latest write to the data files, in seconds since the epoch."""
+        times = [os.stat(path).st_mtime for path in (self.participants_path, self.ratings_path, self.matches_path,
+                                                      self.journal_path) if os.path.exists(path)]
+        return max(times, default=0.0)
+
+    def versions(self):
+        """
+        Versions of the data that can be restored, oldest first.
+
+        Version N is the data right after operation N. The oldest version is the first
+        checkpoint, listed as a 'checkpoint' operation unless an operation has its seq.
+
+        :return: List of operations, each with 'seq' and (if recorded) 'time'
+        """
+        with self._lock:
+            self.refresh()
+            checkpoints = self._checkpoint_seqs()
+            if not checkpoints:
+                return []
+            ops = [op for op in self._history_ops() if checkpoints[0] <= op['seq'] <= self._seq]
+            if not ops or ops[0]['seq'] != checkpoints[0]:
+                ops.insert(0, {'op': 'checkpoint', 'seq': checkpoints[0]})
+            return ops
+
+    def diff_version(self, seq):
+        """
+        What restoring a version would change in the current data.
+
+        :return: Dictionary with 'participants', 'ratings' and 'matches', each a dictionary
+                 of 'added' and 'removed' rows and 'changed' (current row, restored row) tuples
+        :raises ValueError: If the version is not in the history
+        """
+        with self._lock:
+            self.refresh()
+            restored = self._state_at(seq)
+            return {
+                'participants': _diff_rows(self._participants_by_key(), restored._participants_by_key()),
+                'ratings': _diff_rows(self._rating_pairs(), restored._rating_pairs()),
+                'matches': _diff_rows(self.matches, restored.matches),
+            }
+
+    def restore(self, seq):
+        """
+        Replaces the data with an earlier version. The restore is a new version itself,
+        so restoring the version before it undoes it.
+
+        :raises ValueError: If the version is not in the history
+        """
+        with self._writing():
+            restored = self._state_at(seq)
+            rating_rows = list(restored._rating_pairs().values())
+            self._replace_state(list(restored.participants.values()), rating_rows,
+                                list(restored.matches.values()), {'op': 'restore', 'version': seq})
+
+    def compact(self):
+        """Folds the journal into participants.csv, ratings.csv and matches.csv (e.g. before a download)."""
+        with self._writing():
+            if self._journal_ops or not os.path.exists(self.ratings_path):
+                self._compact()
+
+    # --- Queries ---
+    # Queries hold self._lock while they read the in-memory state, since a background
+    # thread (see ingest.py) or another request thread may be applying a write
+
+    def participant_rows(self):
+        with self._lock:
+            self.refresh()
+            return list(self.participants.values())
+
+    def rating_rows(self):
+        with self._lock:
+            self.refresh()
+            return list(self.ratings.values())
+
+    def match_rows(self):
+        with self._lock:
+            self.refresh()
+            return list(self.matches.values())
+
+    def query_ratings(self, rater=None, rated_player=None, rating=None, offset=0, limit=None):
+        """
+        Filtered page of ratings, served from the rater / rated_player / pair indexes.
+
+        :param rater: Only ratings given by this rater (case-insensitive)
+        :param rated_player: Only ratings received by this player (case-insensitive)
+        :param rating: Only ratings with this score
+        :return: Tuple of (list of rating rows, total number of matching rows)
+        """
+        rater_key = normalize_name(rater)
+        rated_key = normalize_name(rated_player)
+        with self._lock:
+            self.refresh()
+            rater_id = self.names.id_of_key(rater_key)
+            rated_id = self.names.id_of_key(rated_key)
+            if (rater_key and rater_id is None) or (rated_key and rated_id is None):
+                rows = []  # No ratings name that player
+            elif rater_key and rated_key:
+                rows = self.by_pair.get((rater_id, rated_id), {}).values()
+            elif rater_key:
+                rows = self.by_rater.get(rater_id, {}).values()
+            elif rated_key:
+                rows = self.by_rated.get(rated_id, {}).values()
+            else:
+                rows = self.ratings.values()
+            if rating is not None:
+                rows = [row for row in rows if row.score == rating]
+            end = None if limit is None else offset + limit
+            return list(itertools.islice(rows, offset, end)), len(rows)
+
+    def get_participant(self, name):
+        with self._lock:
+            self.refresh()
+            return self.participants.get(self.names.id_of(name))
+
+    def rating_counts(self):
+        """Number of ratings per normalized rated_player name."""
+        with self._lock:
+            self.refresh()
+            return {self.names.keys[rated_id]: len(rows) for rated_id, rows in self.by_rated.items()}
+
+    def pick_least_rated(self, rater, k=5):
+        """
+        Picks the k least-rated participants for a rater to rate, excluding the rater.
+
+        The picked players stay reserved for the rater until they submit or the
+        reservation expires, so concurrent raters are spread over different players.
+
+        :return: List of participant display names
+        """
+        with self._lock:
+            self.refresh()
+            # Reservations are keyed by the normalized name, as the rater may not have an id yet
+            picked = self.least_rated.pick(k, exclude={self.names.id_of(rater)}, reserve_for=normalize_name(rater))
+            return [self.participants[name_id]['name'] for name_id in picked]
+
+    def release_reservation(self, rater):
+        with self._lock:
+            self.least_rated.release(normalize_name(rater))
+
+    def player_statistics(self, adjusted=False):
+        """
+        Average, median and count per participant, read from the running aggregates.
+
+        :param adjusted: Also fit rater-bias-corrected scores (see scoring.py) and add them
+                         as 'adjusted' and 'rater_bias' ('N/A' where there is no data)
+        :return: List of dictionaries with 'name', 'average', 'median' and 'count' keys,
+                 in participant order
+        """
+        if adjusted:
+            # Fitted from a copy of the scores, so writes are not held up by the fit
+            adjusted_scores, rater_biases = scoring.adjusted_scores(self._score_triples())
+        statistics_list = []
+        with self._lock:
+            self.refresh()
+            for name_id, participant in self.participants.items():
+                player_stat = self._player_stat(name_id, participant)
+                if adjusted:
+                    player_stat['adjusted'] = adjusted_scores.get(name_id, 'N/A')
+                    player_stat['rater_bias'] = rater_biases.get(name_id, 'N/A')
+                statistics_list.append(player_stat)
+        return statistics_list
+
+    def statistics_for(self, names):
+        """
+        Like player_statistics() without the adjusted scores, for just the given players.
+
+        :return: Tuple of (statistics of the players that exist, names of those that do not)
+        """
+        with self._lock:
+            self.refresh()
+            found = []
+            missing = []
+            for name in names:
+                name_id = self.names.id_of(name)
+                participant = self.participants.get(name_id)
+                if participant is None:
+                    missing.append(name)
+                else:
+                    found.append(self._player_stat(name_id, participant))
+            return found, missing
+
+    def _player_stat(self, name_id, participant):
+        # Self-rating from participants.csv is mixed in with the ratings received
+        stats = self.received_stats.get(name_id, _EMPTY_STATS)
+        stats = stats.with_score(parse_rating(participant['rating']))
+        return {
+            'name': participant['name'],
+            'average': stats.average(),
+            'median': stats.median(),
+            'count': stats.count,
+            'elo': self.elo.rating(name_id),
+            'matches': self.elo.games.get(name_id, 0),
+        }
+
+    def latest_event_id(self):
+        with self._lock:
+            self.refresh()
+            return self._event_id
+
+    def events_since(self, event_id):
+        """
+        Operations applied in this process after the given event id, for live updates.
+
+        :return: Tuple of (latest event id, list of ops), where the list is None if some of
+                 the requested events have already dropped out of the log
+        """
+        with self._lock:
+            self.refresh()
+            latest = self._event_id
+            if event_id > latest or latest - event_id > len(self.events):
+                return latest, None
+            start = len(self.events) - (latest - event_id)
+            return latest, [op for _, op in itertools.islice(self.events, start, None)]
+
+    def _score_triples(self):
+        # (rater id, player id, score) for every valid rating, self-ratings included
+        with self._lock:
+            self.refresh()
+            triples = []
+            for rater_id, rows in self.by_rater.items():
+                for row in rows.values():
+                    if row.score is not None:
+                        triples.append((rater_id, row.rated_id, row.score))
+            for name_id, participant in self.participants.items():
+                score = parse_rating(participant['rating'])
+                if score is not None:
+                    triples.append((name_id, name_id, score))
+            return triples
+
+    # --- Mutations ---
+
+    def add_participant(self, name, rating=''):
+        """
+        Adds a participant unless one with the same (case-insensitive) name exists.
+
+        :return: True if the participant was added
+        """
+        with self._writing():
+            if self.names.id_of(name) in self.participants:
+                return False
+            self._commit({'op': 'add_participant', 'name': name.strip(), 'rating': rating})
+            return True
+
+    def set_self_rating(self, name, rating):
+        """Updates a participant's self-rating, adding the participant if needed."""
+        with self._writing():
+            self._commit({'op': 'set_self_rating', 'name': name, 'rating': rating})
+
+    def update_participant_rating(self, name, rating):
+        """
+        :return: True if the participant exists and was updated
+        """
+        with self._writing():
+            if self.names.id_of(name) not in self.participants:
+                return False
+            self._commit({'op': 'update_participant_rating', 'name': name, 'rating': rating})
+            return True
+
+    def record_match(self, match_id, home, away, home_goals, away_goals):
+        """
+        Stores a match result and updates the Elo rating of everyone who played. Recording
+        the same match id again replaces the earlier result.
+
+        :param home: Player names of the home team
+        :param away: Player names of the away team
+        """
+        home = [name.strip() for name in home if name.strip()]
+        away = [name.strip() for name in away if name.strip()]
+        if any(MEMBER_SEPARATOR in name for name in home + away):
+            raise ValueError(f'Player names in a match cannot contain {MEMBER_SEPARATOR!r}')
+        with self._writing():
+            self._commit({'op': 'record_match', 'match_id': str(match_id), 'home': home, 'away': away,
+                          'home_goals': int(home_goals), 'away_goals': int(away_goals)})
+
+    def bulk_import(self, participants=(), ratings=()):
+        """
+        Merges uploaded participants and ratings in a single atomic batch.
+
+        Participants are deduplicated case-insensitively against the store and each other;
+        an existing participant only gets their self-rating updated. For ratings the latest
+        row per (rater, rated_player) pair wins, replacing any rating already stored.
+
+        :param participants: Iterable of (name, rating or None) tuples
+        :param ratings: Iterable of (rater, rated_player, rating) tuples with valid ratings
+        :return: Dictionary with 'participants_added', 'participants_updated',
+                 'ratings_added' and 'ratings_updated' counts
+        """
+        # Deduplicate the upload itself first; later rows win
+        uploaded_participants = {}
+        for name, rating in participants:
+            key = normalize_name(name)
+            previous = uploaded_participants.get(key)
+            if rating is None and previous is not None:
+                rating = previous[1]
+            uploaded_participants[key] = (previous[0] if previous else name.strip(), rating)
+        uploaded_ratings = {}
+        for rater, rated_player, rating in ratings:
+            uploaded_ratings[(normalize_name(rater), normalize_name(rated_player))] = (rater, rated_player, rating)
+
+        summary = dict.fromkeys(('participants_added', 'participants_updated', 'ratings_added', 'ratings_updated'), 0)
+        with self._writing():
+            ops = []
+            for key, (name, rating) in uploaded_participants.items():
+                existing = self.participants.get(self.names.id_of_key(key))
+                if existing is None:
+                    ops.append({'op': 'add_participant', 'name': name, 'rating': '' if rating is None else str(rating)})
+                    summary['participants_added'] += 1
+                elif rating is not None and existing['rating'] != str(rating):
+                    ops.append({'op': 'update_participant_rating', 'name': name, 'rating': rating})
+                    summary['participants_updated'] += 1
+
+            new_ratings = defaultdict(list)
+            for pair, (rater, rated_player, rating) in uploaded_ratings.items():
+                existing = self.by_pair.get(tuple(self.names.id_of_key(key) for key in pair))
+                if existing is None:
+                    new_ratings[rater].append([rated_player, rating])
+                    summary['ratings_added'] += 1
+                elif any(row.rating != str(rating) for row in existing.values()):
+                    ops.append({'op': 'update_rating', 'rater': rater, 'rated_player': rated_player, 'rating': rating})
+                    summary['ratings_updated'] += 1
+            for rater, given in new_ratings.items():
+                ops.append({'op': 'add_ratings', 'rater': rater, 'ratings': given})
+
+            if ops:
+                self._commit({'op': 'batch', 'ops': ops})
+        return summary
+
+    def remove_participant(self, name):
+        """Removes a participant along with every rating they gave or received."""
+        with self._writing():
+            self._commit({'op': 'remove_participant', 'name': name})
+
+    def add_ratings(self, rater, ratings):
+        """
+        Appends the ratings given by one rater.
+
+        :param ratings: List of (rated_player, rating) tuples with already validated ratings
+        """
+        with self._writing():
+            if ratings:
+                self._commit({'op': 'add_ratings', 'rater': rater, 'ratings': [list(r) for r in ratings]})
+
+    def submit_ratings(self, submissions, batch_id=None):
+        """
+        Stores rate-form submissions, each a self-rating plus the ratings given, as one
+        journal line (one fsync) however many submissions there are.
+
+        :param submissions: List of (rater, self_rating, [(rated_player, rating)]) tuples
+                            with already validated ratings
+        :param batch_id: Unique id for retrying a failed call: nothing is stored if the batch
+                         with this id already was, e.g. when its journal line was written but
+                         the fsync after it failed (unless another worker has compacted the
+                         journal since)
+        """
+        ops = []
+        for rater, self_rating, ratings in submissions:
+            ops.append({'op': 'set_self_rating', 'name': rater, 'rating': self_rating})
+            if ratings:
+                ops.append({'op': 'add_ratings', 'rater': rater, 'ratings': [list(r) for r in ratings]})
+        if not ops:
+            return
+        op = {'op': 'batch', 'ops': ops}
+        if batch_id is not None:
+            op['batch_id'] = batch_id
+        with self._writing():
+            if batch_id is not None and batch_id in self._batch_ids:
+                return
+            self._commit(op)
+
+    def update_rating(self, rater, rated_player, rating):
+        """
+        Sets the rating on every row from rater to rated_player.
+
+        :return: True if a matching rating was found
+        """
+        with self._writing():
+            if not self._pair_rows(rater, rated_player):
+                return False
+            self._commit({'op': 'update_rating', 'rater': rater, 'rated_player': rated_player, 'rating': rating})
+            return True
+
+    def remove_rating(self, rater, rated_player):
+        """
+        Removes every rating from rater to rated_player.
+
+        :return: True if a matching rating was found
+        """
+        with self._writing():
+            if not self._pair_rows(rater, rated_player):
+                return False
+            self._commit({'op': 'remove_rating', 'rater': rater, 'rated_player': rated_player})
+            return True
@@ -0,0 +1,151 @@
+import itertools
+
+# Assumed strength of an unrated player when no one has a rating yet
+DEFAULT_STRENGTH = 3.0
+# Upper bound on local-search passes; each pass tries every swap between paired-up teams
+MAX_PASSES = 200
+# Teams furthest from the target that are tried against every other team after that
+POLISH_TEAMS = 8
+POLISH_PASSES = 20
+
+
+def _is_rated(participant):
+    return isinstance(participant['average'], float)
+
+
+def _combined_avg(members):
+    # Average over the members that have a rating, like the original pair average
+    rated = [m['average'] for m in members if _is_rated(m)]
+    if not rated:
+        return 'N/A'
+    return round(sum(rated) / len(rated), 2)
+
+
+def _team(members):
+    return {'members': [m['name'] for m in members], 'combined_avg': _combined_avg(members)}
+
+
+def greedy_teams(participants, team_size=2):
+    """
+    The original method: repeatedly takes the highest and lowest rated players left.
+    Unrated players are appended at the end in list order.
+    """
+    rated = sorted([p for p in participants if _is_rated(p)], key=lambda p: p['average'], reverse=True)
+    unrated = [p for p in participants if not _is_rated(p)]
+    ordered = []
+    while rated:
+        ordered.append(rated.pop(0))  # Highest rated
+        if rated:
+            ordered.append(rated.pop(-1))  # Lowest rated
+    ordered.extend(unrated)
+
+    teams = []
+    for i in range(0, len(ordered) - len(ordered) % team_size, team_size):
+        teams.append(_team(ordered[i:i + team_size]))
+    return teams
+
+
+def balanced_teams(participants, team_size=2):
+    """
+    Splits everyone into teams whose average strengths are as equal as possible.
+
+    Starts from a snake draft, then repeatedly pairs strong teams with weak ones and applies
+    the member swap that most reduces the squared deviation of their averages, and finally
+    tries swaps between the worst remaining teams and all others. Unrated players count as an average
+    player. When the count does not divide evenly, the leftover players join the weakest
+    teams, so nobody is left out.
+    """
+    if not participants:
+        return []
+
+    rated_averages = [p['average'] for p in participants if _is_rated(p)]
+    default = sum(rated_averages) / len(rated_averages) if rated_averages else DEFAULT_STRENGTH
+    strength = [p['average'] if _is_rated(p) else default for p in participants]
+
+    order = sorted(range(len(participants)), key=lambda i: strength[i], reverse=True)
+    num_teams = max(1, len(participants) // team_size)
+
+    # Snake draft: 1..n, n..1, 1..n, ...
+    teams = [[] for _ in range(num_teams)]
+    drafted = min(len(order), num_teams * team_size)
+    for position, index in enumerate(order[:drafted]):
+        round_number, slot = divmod(position, num_teams)
+        teams[slot if round_number % 2 == 0 else num_teams - 1 - slot].append(index)
+    for index in order[drafted:]:
+        weakest = min(teams, key=lambda t: (sum(strength[i] for i in t) / len(t), len(t)))
+        weakest.append(index)
+
+    totals = [sum(strength[i] for i in team) for team in teams]
+    target = sum(strength) / len(strength)
+
+    def cost(total, size):
+        return (total / size - target) ** 2
+
+    def best_swap(a, b):
+        # Member swap between teams a and b that most lowers their combined cost, if any
+        team_a, team_b = teams[a], teams[b]
+        current = cost(totals[a], len(team_a)) + cost(totals[b], len(team_b))
+        best = None
+        for x, y in itertools.product(range(len(team_a)), range(len(team_b))):
+            delta = strength[team_b[y]] - strength[team_a[x]]
+            if not delta:
+                continue
+            new = cost(totals[a] + delta, len(team_a)) + cost(totals[b] - delta, len(team_b))
+            if new < current - 1e-12:
+                current, best = new, (current - new, a, b, x, y, delta)
+        return best
+
+    def swap(move):
+        _, a, b, x, y, delta = move
+        teams[a][x], teams[b][y] = teams[b][y], teams[a][x]
+        totals[a] += delta
+        totals[b] -= delta
+
+    # Pair the strongest team with the weakest, the second strongest with the second
+    # weakest, and so on: those swaps reduce the spread the most and a pass is O(n log n)
+    for _ in range(MAX_PASSES):
+        order = sorted(range(num_teams), key=lambda t: totals[t] / len(teams[t]))
+        moves = [best_swap(a, b) for a, b in zip(order[::-1], order[:num_teams // 2])]
+        moves = [move for move in moves if move]
+        for move in moves:
+            swap(move)
+        if not moves:
+            break
+
+    # Polish the teams furthest from the target against every other team
+    for _ in range(POLISH_PASSES):
+        order = sorted(range(num_teams), key=lambda t: cost(totals[t], len(teams[t])), reverse=True)
+        improved = False
+        for a in order[:POLISH_TEAMS]:
+            moves = [move for move in (best_swap(a, b) for b in range(num_teams) if b != a) if move]
+            if moves:
+                swap(max(moves))
+                improved = True
+        if not improved:
+            break
+
+    ranked = sorted(zip(totals, teams), key=lambda pair: pair[0] / len(pair[1]), reverse=True)
+    return [_team([participants[i] for i in team]) for _, team in ranked]
+
+
+# Available pairing engines, selectable by name
+TEAM_STRATEGIES = {
+    'balanced': balanced_teams,
+    'greedy': greedy_teams,
+}
+
+
+def assign_teams(participants, team_size=2, method='balanced'):
+    """
+    Assigns participants into teams, aiming for balanced average ratings.
+
+    :param participants: List of dictionaries with 'name' and 'average' keys
+    :param team_size: Number of players per team
+    :param method: Name of a strategy in TEAM_STRATEGIES
+    :return: List of teams, each a dictionary with 'members' (names) and 'combined_avg'
+    """
+    if team_size < 1:
+        raise ValueError('team_size must be at least 1')
+    if method not in TEAM_STRATEGIES:
+        raise ValueError(f'Unknown team method: {method}')
+    return TEAM_STRATEGIES[method](participants, team_size)